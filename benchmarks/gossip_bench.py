@@ -0,0 +1,93 @@
+"""
+Gossip propagation benchmark.
+
+Starts clusters of GossipNodes on localhost, publishes items from random
+nodes and measures how long each takes to reach every node and how many bytes
+each node receives per item, compared with flooding (fan-out to every peer):
+
+    python benchmarks/gossip_bench.py --sizes 8 16 32 64 --items 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+import gossip
+from gossip import GossipNode
+
+HOST = "127.0.0.1"
+
+
+def run_cluster(size, items, base_port, fanout, payload_size, timeout):
+    addresses = [(HOST, base_port + i) for i in range(size)]
+    arrivals = {}  # hash -> number of nodes that have it
+    done = threading.Condition()
+
+    def on_item(h, item):
+        with done:
+            arrivals[h] = arrivals.get(h, 0) + 1
+            done.notify_all()
+
+    nodes = [GossipNode(HOST, port, addresses, on_item=on_item, fanout=fanout).start() for _, port in addresses]
+    delays = []
+    for i in range(items):
+        item = {"seq": i, "payload": os.urandom(payload_size).hex()}
+        start = time.perf_counter()
+        h = random.choice(nodes).publish(item)
+        with done:
+            complete = done.wait_for(lambda: arrivals.get(h, 0) == size, timeout)
+        delays.append(time.perf_counter() - start if complete else None)
+    time.sleep(gossip.GOSSIP_INTERVAL * 5)  # Let the last announcements land before counting
+    for node in nodes:
+        node.stop()
+
+    reached = [d for d in delays if d is not None]
+    bytes_in = sum(node.stats["bytes_in"] for node in nodes)
+    return {
+        "nodes": size,
+        "fanout": nodes[0].fanout,
+        "items": items,
+        "complete": len(reached),
+        "mean_delay": sum(reached) / len(reached) if reached else None,
+        "max_delay": max(reached) if reached else None,
+        "bytes_per_node_per_item": bytes_in / size / items,
+        "duplicate_items": sum(node.stats["duplicate_items"] for node in nodes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--payload-size", type=int, default=1024, help="Random bytes per item")
+    parser.add_argument("--base-port", type=int, default=6000)
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for an item to reach every node")
+    parser.add_argument("--no-flood", action="store_true", help="Skip the flooding baseline")
+    parser.add_argument("--output", default="gossip_bench.json")
+    args = parser.parse_args()
+
+    results = []
+    port = args.base_port
+    for size in args.sizes:
+        for mode, fanout in [("gossip", None)] + ([] if args.no_flood else [("flood", size - 1)]):
+            result = run_cluster(size, args.items, port, fanout, args.payload_size, args.timeout)
+            result["mode"] = mode
+            results.append(result)
+            port += size  # Fresh ports: the previous cluster's connections may still be closing
+            mean = f"{result['mean_delay'] * 1000:8.1f} ms" if result["mean_delay"] is not None else "     n/a"
+            print(f"{mode:6} nodes={size:>3} fanout={result['fanout']:>3} reached={result['complete']}/{args.items} "
+                  f"mean={mean} bytes/node/item={result['bytes_per_node_per_item']:>8.0f} "
+                  f"duplicate items={result['duplicate_items']}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Proof of Work micro-benchmarks.
+
+Measures hashes/second and time-to-solution of every PoW variant in the repo,
+sweeping difficulty, payload size, thread count and process count, and writes
+the results as JSON so runs on different commits can be compared:
+
+    python benchmarks/pow_bench.py --output before.json
+    python benchmarks/pow_bench.py --output after.json
+    python benchmarks/pow_bench.py --compare before.json after.json
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+from parallel_mining import mine_parallel
+from pow_engine import target_for_zeros
+
+PREVIOUS_HASH = "0" * 64
+
+
+def load_module(name, relative_path):
+    """Import a lab script by path (the lab folders are not packages)."""
+    path = os.path.join(ROOT, relative_path)
+    if os.path.dirname(path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(path))  # For the script's sibling imports
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_payload(size, seed):
+    """Transactions whose JSON encoding is roughly `size` bytes."""
+    transactions = []
+    while len(json.dumps(transactions)) < size:
+        i = len(transactions)
+        transactions.append({"sender": f"user{seed}-{i}", "receiver": f"user{i + 1}", "amount": i % 50 + 0.5})
+    return transactions
+
+
+# Reference copies of the loops the repo used before the mining engine, so the
+# cost of each serialization choice stays measurable after they were replaced.
+def legacy_fstring_loop(data, zeros):
+    nonce = 0
+    prefix = "0" * zeros
+    while True:
+        if hashlib.sha256(f"{data}{nonce}".encode()).hexdigest().startswith(prefix):
+            return nonce
+        nonce += 1
+
+
+def legacy_json_dumps_loop(previous_hash, transactions, zeros):
+    nonce = 0
+    while True:
+        block_hash = hashlib.sha256(f"{previous_hash}{json.dumps(transactions)}{nonce}".encode()).hexdigest()
+        if block_hash[:zeros] == "0" * zeros:
+            return nonce
+        nonce += 1
+
+
+_variants = None
+_skipped = {}
+
+
+def get_variants():
+    """name -> fn(data, transactions, zeros) returning the winning nonce."""
+    global _variants
+    if _variants is not None:
+        return _variants
+
+    pow_module = load_module("bench_pow", "proof-of-work/task/pow.py")
+    pow_alt = load_module("bench_pow_alt", "proof-of-work/task/pow_alt.py")
+    sim_2 = load_module("bench_sim_2", "btc-mining-simulation/sim_2.py")
+
+    # pow.py and pow_alt.py count difficulty in pairs of zeros
+    _variants = {
+        "pow.proof_of_work": lambda data, txs, zeros: pow_module.proof_of_work(data, zeros // 2)[0],
+        "pow_alt.proof_of_work": lambda data, txs, zeros: pow_alt.proof_of_work(data, zeros // 2)[0],
+        "sim_2.proof_of_work": lambda data, txs, zeros: sim_2.proof_of_work(PREVIOUS_HASH, txs, zeros)[0],
+        "legacy.fstring_per_nonce": lambda data, txs, zeros: legacy_fstring_loop(data, zeros),
+        "legacy.json_dumps_per_nonce": lambda data, txs, zeros: legacy_json_dumps_loop(PREVIOUS_HASH, txs, zeros),
+    }
+    try:
+        task1 = load_module("bench_task1", "btc-mining-simulation/task1.py")
+        _variants["BlockchainNode.proof_of_work"] = (
+            lambda data, txs, zeros: task1.BlockchainNode.proof_of_work(None, PREVIOUS_HASH, txs, zeros)[0]
+        )
+    except ImportError as e:
+        _skipped["BlockchainNode.proof_of_work"] = str(e)
+    return _variants
+
+
+def run_once(name, payload_size, seed, zeros):
+    """Run one search, returns (hashes tried, seconds)."""
+    transactions = make_payload(payload_size, seed)
+    data = json.dumps(transactions)
+    start = time.perf_counter()
+    nonce = get_variants()[name](data, transactions, zeros)
+    return nonce + 1, time.perf_counter() - start
+
+
+def _summarize(name, mode, zeros, payload_size, workers, runs, wall):
+    hashes = sum(h for h, _ in runs)
+    return {
+        "variant": name,
+        "mode": mode,
+        "difficulty": zeros,
+        "payload_bytes": payload_size,
+        "workers": workers,
+        "hashes": hashes,
+        "seconds": wall,
+        "hashes_per_second": hashes / wall if wall else 0.0,
+        "time_to_solution": sum(s for _, s in runs) / len(runs),
+    }
+
+
+def bench_single(name, zeros, payload_size, repeats):
+    runs = [run_once(name, payload_size, seed, zeros) for seed in range(repeats)]
+    return _summarize(name, "single", zeros, payload_size, 1, runs, sum(s for _, s in runs))
+
+
+def bench_threads(name, zeros, payload_size, count):
+    runs = [None] * count
+
+    def work(i):
+        runs[i] = run_once(name, payload_size, i, zeros)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summarize(name, "threads", zeros, payload_size, count, runs, time.perf_counter() - start)
+
+
+def _load_variants(_):
+    get_variants()
+
+
+def bench_processes(name, zeros, payload_size, count):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=count) as pool:
+        # Warm the workers up so process start-up and imports are not timed
+        list(pool.map(_load_variants, range(count)))
+        start = time.perf_counter()
+        runs = list(pool.map(run_once, [name] * count, [payload_size] * count, range(count), [zeros] * count))
+        wall = time.perf_counter() - start
+    return _summarize(name, "processes", zeros, payload_size, count, runs, wall)
+
+
+def bench_mine_parallel(zeros, payload_size, count, repeats):
+    """Time-to-solution of the process mining backend; hash counts are not observable there."""
+    times = []
+    for seed in range(repeats):
+        prefix = f"{PREVIOUS_HASH}{json.dumps(make_payload(payload_size, seed))}"
+        times.append(mine_parallel(prefix, target_for_zeros(zeros), workers=count)[3])
+    return {
+        "variant": "parallel_mining.mine_parallel",
+        "mode": "processes",
+        "difficulty": zeros,
+        "payload_bytes": payload_size,
+        "workers": count,
+        "hashes": None,
+        "seconds": sum(times),
+        "hashes_per_second": None,
+        "time_to_solution": sum(times) / len(times),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    variants = get_variants()
+    names = [name for name in variants if not args.variants or name in args.variants]
+    results = []
+    for zeros in args.difficulties:
+        for payload_size in args.payload_sizes:
+            for name in names:
+                single = bench_single(name, zeros, payload_size, args.repeats)
+                results.append(single)
+                print(f"{name:32} zeros={zeros} payload={payload_size:>6}B "
+                      f"{single['hashes_per_second']:>12,.0f} H/s")
+                for count in args.threads:
+                    results.append(bench_threads(name, zeros, payload_size, count))
+                for count in args.processes:
+                    results.append(bench_processes(name, zeros, payload_size, count))
+            for count in args.processes:
+                results.append(bench_mine_parallel(zeros, payload_size, count, args.repeats))
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "skipped": _skipped,
+        "results": results,
+    }
+
+
+def compare(old_path, new_path):
+    """Print hashes/second and time-to-solution ratios between two result files."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def key(r):
+        return r["variant"], r["mode"], r["difficulty"], r["payload_bytes"], r["workers"]
+
+    old_results = {key(r): r for r in old["results"]}
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for r in new["results"]:
+        before = old_results.get(key(r))
+        if before is None:
+            continue
+        speedup = before["time_to_solution"] / r["time_to_solution"] if r["time_to_solution"] else 0.0
+        print(f"{r['variant']:32} {r['mode']:9} zeros={r['difficulty']} payload={r['payload_bytes']:>6}B "
+              f"workers={r['workers']:>2}  time-to-solution x{speedup:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--difficulties", type=int, nargs="+", default=[2, 4],
+                        help="Leading hex zeros; even values so pow.py's zero pairs match")
+    parser.add_argument("--payload-sizes", type=int, nargs="+", default=[64, 1024, 16384])
+    parser.add_argument("--threads", type=int, nargs="*", default=[2, 4])
+    parser.add_argument("--processes", type=int, nargs="*", default=[2, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--variants", nargs="*", help="Only run these variants")
+    parser.add_argument("--output", default="pow_bench.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_suite(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    for name, reason in _skipped.items():
+        print(f"Skipped {name}: {reason}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from pow_engine import binary_nonce
+from merkle import merkle_root, transaction_hash
+
+VERSION = 1
+
+# version, previous hash, merkle root, timestamp, bits (required leading zero bits), nonce
+HEADER = struct.Struct(">I32s32sQIQ")
+HEADER_SIZE = HEADER.size  # 88 bytes, whatever the number of transactions
+HEADER_PREFIX = struct.Struct(">I32s32sQI")  # Everything except the nonce
+
+
+def transaction_list(transactions):
+    """Blocks carry either one transaction dict or a list of them."""
+    return transactions if isinstance(transactions, list) else [transactions]
+
+
+def transactions_root(transactions):
+    """Hex Merkle root over a block's transactions."""
+    return merkle_root([transaction_hash(tx) for tx in transaction_list(transactions)]).hex()
+
+
+def new_header(previous_hash, transactions, difficulty):
+    """Header fields of a block about to be mined, everything but the nonce."""
+    return {
+        "version": VERSION,
+        "previous_hash": previous_hash,
+        "merkle_root": transactions_root(transactions),
+        "timestamp": int(time.time()),
+        "bits": difficulty * 4  # Each leading hex zero is four zero bits
+    }
+
+
+def header_prefix(header):
+    """Pack the fixed part of a header; `header` can be a header or a whole block dict."""
+    return HEADER_PREFIX.pack(
+        header["version"],
+        bytes.fromhex(header["previous_hash"]),
+        bytes.fromhex(header["merkle_root"]),
+        header["timestamp"],
+        header["bits"]
+    )
+
+
+def pack_header(header, nonce):
+    return header_prefix(header) + binary_nonce(nonce)
+
+
+def header_target(header):
+    return 1 << (256 - header["bits"])
+
+
+def hash_header(header, nonce):
+    return hashlib.sha256(pack_header(header, nonce)).hexdigest()
+
+
+def check_header(block, difficulty):
+    """Check a header block's stored hash and that it meets `difficulty` leading hex zeros."""
+    block_hash = hash_header(block, block["nonce"])
+    return (block["bits"] >= difficulty * 4
+            and int(block_hash, 16) < header_target(block)
+            and block_hash == block["hash"])
+
+
+def legacy_preimages(block):
+    """What each script hashed before the binary header format, for a block of that shape."""
+    transactions = block["transactions"]
+    if isinstance(transactions, dict) and all(field in transactions for field in ("sender", "receiver", "amount")):
+        # task1.py: the transaction as "sender->receiver:amount"
+        yield f"{block['previous_hash']}{transactions['sender']}->{transactions['receiver']}:{transactions['amount']}{block['nonce']}"
+    yield f"{block['previous_hash']}{json.dumps(transactions)}{block['nonce']}"  # task2.py, sim_2.py
+    yield f"{block['previous_hash']}{transactions}{block['nonce']}"  # main.py, str() of the transaction
+
+
+def check_legacy_block(block, difficulty):
+    """Check a pre-header block's stored hash against the legacy preimages and `difficulty` leading hex zeros."""
+    if not (isinstance(block.get("previous_hash"), str) and isinstance(block.get("nonce"), int)
+            and isinstance(block.get("hash"), str) and isinstance(block.get("transactions"), (dict, list))):
+        return False, "Malformed legacy block"
+    if not any(hashlib.sha256(preimage.encode()).hexdigest() == block["hash"] for preimage in legacy_preimages(block)):
+        return False, "Hash matches no legacy block format"
+    if not block["hash"].startswith("0" * difficulty):
+        return False, "Insufficient proof of work"
+    return True, "Valid legacy PoW"
@@ -0,0 +1,99 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from blockstore import BlockStore
+from compact_block import CompactBlock, pack_hash
+from block_header import VERSION, check_header, check_legacy_block, transaction_list
+from merkle import merkle_proof, transaction_hash, verify_merkle_proof
+
+LEDGER_FILE = "blockchain_ledger.json"  # Whole-ledger JSON, migrated once into the block store
+BLOCK_STORE_FILE = "blockchain_ledger.jsonl"
+DIFFICULTY = 4  # Number of leading zeros required
+HEADER_FIELDS = ("version", "previous_hash", "merkle_root", "timestamp", "bits", "nonce", "hash")
+
+
+def transaction_proof(block, index):
+    """Served by full nodes: proof that the block's index-th transaction is in its Merkle root."""
+    leaves = [transaction_hash(tx) for tx in transaction_list(block["transactions"])]
+    return {"block_hash": block["hash"], "index": index, "branch": merkle_proof(leaves, index)}
+
+
+def block_to_header(block):
+    """Drop the transactions, keeping only what the light client needs.
+
+    Blocks mined before the binary header format hash their whole payload, so
+    they keep their transactions: the hash can't be checked without them.
+    """
+    if "version" not in block:
+        return {field: block[field] for field in ("previous_hash", "transactions", "nonce", "hash") if field in block}
+    return {field: block[field] for field in HEADER_FIELDS if field in block}
+
+
+class LightClient:
+    """Keeps only the header chain and checks transactions against it with Merkle proofs."""
+
+    def __init__(self, difficulty=DIFFICULTY):
+        self.difficulty = difficulty
+        self.headers = []
+        self.heights = {}  # Raw block hash -> height
+
+    @classmethod
+    def from_ledger(cls, store_file=BLOCK_STORE_FILE, difficulty=DIFFICULTY):
+        client = cls(difficulty)
+        for block in BlockStore(store_file, legacy_json=LEDGER_FILE):
+            is_valid, message = client.add_header(block_to_header(block))
+            if not is_valid:
+                raise ValueError(f"Invalid header chain at height {len(client.headers)}: {message}")
+        return client
+
+    def add_header(self, header):
+        """Append a header after checking its link to the tip and its proof of work."""
+        expected_previous = self.headers[-1]["hash"] if self.headers else "0" * 64
+        if header["previous_hash"] != expected_previous:
+            return False, "Previous hash doesn't match the current tip"
+        if "version" not in header:
+            if self.headers and "version" in self.headers[-1]:
+                return False, "Legacy header after a header-format block"
+            is_valid, message = check_legacy_block(header, self.difficulty)
+            if not is_valid:
+                return False, message
+            header = {field: value for field, value in header.items() if field != "transactions"}  # Checked, not kept
+        elif not check_header(header, self.difficulty):
+            return False, "Header hash mismatch or insufficient proof of work"
+        self.heights[pack_hash(header["hash"])] = len(self.headers)
+        self.headers.append(CompactBlock(header))  # Slotted, with raw digests instead of hex strings
+        return True, "Valid header"
+
+    def verify_transaction(self, transaction, proof):
+        """Check that `transaction` is included in a block of the header chain."""
+        height = self.heights.get(pack_hash(proof["block_hash"]))
+        if height is None:
+            return False, "Unknown block"
+        header = self.headers[height]
+        if header.get("version", 0) < VERSION:
+            return False, "Block predates Merkle roots, full block needed"
+        root = bytes.fromhex(header["merkle_root"])
+        if not verify_merkle_proof(transaction_hash(transaction), proof["branch"], root):
+            return False, "Merkle proof doesn't match the block's root"
+        return True, f"Transaction included at height {height}"
+
+
+if __name__ == "__main__":
+    client = LightClient.from_ledger()
+    print(f"Light client holds {len(client.headers)} headers, tip: {client.headers[-1]['hash']}")
+
+    # A full node hands out a proof for a transaction in the latest header-format block
+    store = BlockStore(BLOCK_STORE_FILE, legacy_json=LEDGER_FILE)
+    block = None
+    for height in range(len(store) - 1, -1, -1):
+        if "version" in store[height]:
+            block = store[height]
+            break
+    if block is None:
+        print("No header-format blocks mined yet.")
+    else:
+        transaction = transaction_list(block["transactions"])[0]
+        proof = transaction_proof(block, 0)
+        print(f"Proof of {len(proof['branch'])} hashes for {transaction}")
+        print(client.verify_transaction(transaction, proof))
@@ -1,11 +1,20 @@
+import os
+import sys
 import json
 import hashlib
 import random
 import time
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from pow_engine import binary_nonce
+from parallel_mining import mine_parallel
+from blockstore import BlockStore
+from block_header import header_prefix, header_target, new_header
+
 # Ledger file to store blockchain data
-LEDGER_FILE = "blockchain_ledger.json"
+LEDGER_FILE = "blockchain_ledger.json"  # Whole-ledger JSON, migrated once into the block store
+BLOCK_STORE_FILE = "blockchain_ledger.jsonl"
 REWARD = 6.25  # Block reward in BTC
 
 # Simulated transaction
@@ -16,67 +25,48 @@ transaction = {
     "signature": "Alice_signed_tx"
 }
 
-# Initialize blockchain ledger
-try:
-    with open(LEDGER_FILE, "r") as file:
-        blockchain = json.load(file)
-except FileNotFoundError:
-    blockchain = []
-
 def calculate_hash(block_header):
     return hashlib.sha256(block_header.encode()).hexdigest()
 
-def proof_of_work(previous_hash, transactions, difficulty=4):
-    nonce = 0
-    while True:
-        block_header = f"{previous_hash}{transactions}{nonce}"
-        block_hash = calculate_hash(block_header)
-        if block_hash[:difficulty] == "0" * difficulty:
-            return nonce, block_hash
-        nonce += 1
-
-def mine_block(miner_id, previous_hash, transactions, difficulty, result, lock):
-    print(f"Miner {miner_id} is mining...")
-    start_time = time.time()
-    nonce, block_hash = proof_of_work(previous_hash, transactions, difficulty)
-    end_time = time.time()
-    print(f"Miner {miner_id} found a block! Nonce: {nonce}, Hash: {block_hash} (Time: {end_time - start_time:.2f}s)")
+def mine_block(miners, previous_hash, transactions, difficulty, result, lock):
+    for miner_id in miners:
+        print(f"Miner {miner_id} is mining...")
+    # One process per miner, each searching its own nonce ranges of the binary header
+    header = new_header(previous_hash, transactions, difficulty)
+    index, nonce, block_hash, time_taken = mine_parallel(
+        header_prefix(header), header_target(header), workers=len(miners), encode=binary_nonce
+    )
+    miner_id = miners[index]
+    print(f"Miner {miner_id} found a block! Nonce: {nonce}, Hash: {block_hash} (Time: {time_taken:.2f}s)")
     
     with lock:
         if "winner" not in result:  # Ensure only the first miner to solve PoW wins
             result["winner"] = {
                 "miner": miner_id,
-                "previous_hash": previous_hash,
+                **header,
                 "transactions": transactions,
                 "reward": {"miner": miner_id, "amount": REWARD},
                 "nonce": nonce,
                 "hash": block_hash,
-                "timestamp": time.time()
+                "time_taken": time_taken
             }
 
-# Simulate mining competition with multithreading
-previous_hash = blockchain[-1]["hash"] if blockchain else "0" * 64
-miners = ["Miner A", "Miner B", "Miner C", "Miner D", "Miner E", "Miner F"]
-threads = []
-result = {}
-lock = threading.Lock()
-
-def start_mining(miner):
-    mine_block(miner, previous_hash, transaction, 4, result, lock)
+if __name__ == "__main__":
+    # Initialize blockchain ledger
+    block_store = BlockStore(BLOCK_STORE_FILE, legacy_json=LEDGER_FILE)
+    blockchain = block_store  # Blocks are decoded from the memory-mapped file on access
 
-for miner in miners:
-    thread = threading.Thread(target=start_mining, args=(miner,))
-    threads.append(thread)
-    thread.start()
+    # Simulate mining competition with multiprocessing
+    previous_hash = blockchain[-1]["hash"] if blockchain else "0" * 64
+    miners = ["Miner A", "Miner B", "Miner C", "Miner D", "Miner E", "Miner F"]
+    result = {}
+    lock = threading.Lock()
 
-for thread in threads:
-    thread.join()
+    mine_block(miners, previous_hash, transaction, 4, result, lock)
 
-new_block = result["winner"]
+    new_block = result["winner"]
 
-# Add block to blockchain
-blockchain.append(new_block)
-with open(LEDGER_FILE, "w") as file:
-    json.dump(blockchain, file, indent=4)
+    # Add block to blockchain
+    block_store.append(new_block)
 
-print(f"Blockchain updated! Transaction confirmed. {new_block['miner']} received {REWARD} BTC as a reward.")
+    print(f"Blockchain updated! Transaction confirmed. {new_block['miner']} received {REWARD} BTC as a reward.")
@@ -0,0 +1,48 @@
+import hashlib
+import json
+
+
+def transaction_hash(transaction):
+    """SHA-256 of a transaction's canonical JSON encoding."""
+    return hashlib.sha256(json.dumps(transaction, sort_keys=True).encode()).digest()
+
+
+def merkle_root(leaf_hashes):
+    """Root of a Bitcoin-style Merkle tree (odd levels duplicate their last hash)."""
+    if not leaf_hashes:
+        return b"\x00" * 32
+    level = list(leaf_hashes)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def merkle_proof(leaf_hashes, index):
+    """
+    Inclusion proof for the leaf at `index`: the sibling hashes from the leaf up
+    to the root, as a list of (sibling_hex, "left" | "right").
+    """
+    proof = []
+    level = list(leaf_hashes)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = index ^ 1
+        proof.append((level[sibling].hex(), "left" if sibling < index else "right"))
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf_hash, proof, root):
+    """Recompute the root from a leaf and its proof, O(log n) hashes."""
+    current = leaf_hash
+    for sibling_hex, side in proof:
+        sibling = bytes.fromhex(sibling_hex)
+        if side == "left":
+            current = hashlib.sha256(sibling + current).digest()
+        else:
+            current = hashlib.sha256(current + sibling).digest()
+    return current == root
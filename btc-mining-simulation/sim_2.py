@@ -1,66 +1,68 @@
+import os
+import sys
 import json
 import hashlib
 import random
 import time
 import threading
 
-LEDGER_FILE = "blockchain_ledger.json"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from pow_engine import binary_nonce
+from parallel_mining import mine_parallel
+from blockstore import BlockStore
+from block_header import check_header, hash_header, header_prefix, header_target, new_header, transactions_root
+
+LEDGER_FILE = "blockchain_ledger.json"  # Whole-ledger JSON, migrated once into the block store
+BLOCK_STORE_FILE = "blockchain_ledger.jsonl"
 REWARD = 6.25  # Block reward in BTC
 DIFFICULTY = 4  # Number of leading zeros required
 
-# Initialize blockchain ledger
-try:
-    with open(LEDGER_FILE, "r") as file:
-        blockchain = json.load(file)
-except FileNotFoundError:
-    blockchain = []
-
 def calculate_hash(block_header):
     return hashlib.sha256(block_header.encode()).hexdigest()
 
-def proof_of_work(previous_hash, transactions, difficulty):
-    nonce = 0
-    while True:
-        block_header = f"{previous_hash}{json.dumps(transactions)}{nonce}"
-        block_hash = calculate_hash(block_header)
-        if block_hash[:difficulty] == "0" * difficulty:
-            return nonce, block_hash
-        nonce += 1
-
 def verify_block(block, difficulty):
-    block_header = f"{block['previous_hash']}{json.dumps(block['transactions'])}{block['nonce']}"
-    block_hash = calculate_hash(block_header)
-    return block_hash[:difficulty] == "0" * difficulty and block_hash == block["hash"]
+    if "version" not in block:  # Blocks mined before the binary header format
+        block_header = f"{block['previous_hash']}{json.dumps(block['transactions'])}{block['nonce']}"
+        block_hash = calculate_hash(block_header)
+        return block_hash[:difficulty] == "0" * difficulty and block_hash == block["hash"]
+    return block["merkle_root"] == transactions_root(block["transactions"]) and check_header(block, difficulty)
 
-def mine_block(miner_id, previous_hash, transactions, difficulty, result, lock):
-    print(f"Miner {miner_id} is mining...")
-    start_time = time.time()
-    
-    if miner_id == "Miner E":  # Miner E sends an invalid nonce
-        nonce = random.randint(1, 1000000)  # Arbitrary invalid nonce
-        block_hash = calculate_hash(f"{previous_hash}{json.dumps(transactions)}{nonce}")
-    else:
-        nonce, block_hash = proof_of_work(previous_hash, transactions, difficulty)
-    
-    end_time = time.time()
-    print(f"Miner {miner_id} found a block! Nonce: {nonce}, Hash: {block_hash} (Time: {end_time - start_time:.2f}s)")
+def submit_block(miner_id, header, transactions, nonce, block_hash, time_taken, difficulty, result, lock):
+    print(f"Miner {miner_id} found a block! Nonce: {nonce}, Hash: {block_hash} (Time: {time_taken:.2f}s)")
+    block = {
+        "miner": miner_id,
+        **header,
+        "transactions": transactions,
+        "reward": {"miner": miner_id, "amount": REWARD},
+        "nonce": nonce,
+        "hash": block_hash,
+        "time_taken": time_taken
+    }
     
     with lock:
-        if "winner" not in result and verify_block({
-            "previous_hash": previous_hash,
-            "transactions": transactions,
-            "nonce": nonce,
-            "hash": block_hash
-        }, difficulty):
-            result["winner"] = {
-                "miner": miner_id,
-                "previous_hash": previous_hash,
-                "transactions": transactions,
-                "reward": {"miner": miner_id, "amount": REWARD},
-                "nonce": nonce,
-                "hash": block_hash,
-                "timestamp": time.time()
-            }
+        if "winner" not in result and verify_block(block, difficulty):
+            result["winner"] = block
+
+def mine_block(miners, previous_hash, transactions, difficulty, result, lock):
+    header = new_header(previous_hash, transactions, difficulty)
+    honest_miners = []
+    for miner_id in miners:
+        print(f"Miner {miner_id} is mining...")
+        if miner_id == "Miner E":  # Miner E sends an invalid nonce
+            start_time = time.time()
+            nonce = random.randint(1, 1000000)  # Arbitrary invalid nonce
+            block_hash = hash_header(header, nonce)
+            submit_block(miner_id, header, transactions, nonce, block_hash,
+                         time.time() - start_time, difficulty, result, lock)
+        else:
+            honest_miners.append(miner_id)
+    
+    # Honest miners run one process each, searching disjoint nonce ranges
+    index, nonce, block_hash, time_taken = mine_parallel(
+        header_prefix(header), header_target(header), workers=len(honest_miners), encode=binary_nonce
+    )
+    submit_block(honest_miners[index], header, transactions, nonce, block_hash,
+                 time_taken, difficulty, result, lock)
 
 # Generate random transactions
 def generate_transactions(num=5):
@@ -72,33 +74,26 @@ def generate_transactions(num=5):
         transactions.append({"sender": sender, "receiver": receiver, "amount": amount})
     return transactions
 
-# Get the last block hash
-previous_hash = blockchain[-1]["hash"] if blockchain else "0" * 64
-miners = ["Miner A", "Miner B", "Miner C", "Miner D", "Miner E"]
-threads = []
-result = {}
-lock = threading.Lock()
-transactions = generate_transactions()
+if __name__ == "__main__":
+    # Initialize blockchain ledger
+    block_store = BlockStore(BLOCK_STORE_FILE, legacy_json=LEDGER_FILE)
+    blockchain = block_store  # Blocks are decoded from the memory-mapped file on access
 
-def start_mining(miner):
-    mine_block(miner, previous_hash, transactions, DIFFICULTY, result, lock)
+    # Get the last block hash
+    previous_hash = blockchain[-1]["hash"] if blockchain else "0" * 64
+    miners = ["Miner A", "Miner B", "Miner C", "Miner D", "Miner E"]
+    result = {}
+    lock = threading.Lock()
+    transactions = generate_transactions()
 
-for miner in miners:
-    thread = threading.Thread(target=start_mining, args=(miner,))
-    threads.append(thread)
-    thread.start()
+    mine_block(miners, previous_hash, transactions, DIFFICULTY, result, lock)
 
-for thread in threads:
-    thread.join()
+    if "winner" in result:
+        new_block = result["winner"]
 
-if "winner" in result:
-    new_block = result["winner"]
-    
-    # Block verification by network
-    if verify_block(new_block, DIFFICULTY):
-        blockchain.append(new_block)
-        with open(LEDGER_FILE, "w") as file:
-            json.dump(blockchain, file, indent=4)
-        print(f"Blockchain updated! Transaction confirmed. {new_block['miner']} received {REWARD} BTC as a reward.")
-    else:
-        print(f"Block mined by {new_block['miner']} is invalid and rejected by the network.")
+        # Block verification by network
+        if verify_block(new_block, DIFFICULTY):
+            block_store.append(new_block)
+            print(f"Blockchain updated! Transaction confirmed. {new_block['miner']} received {REWARD} BTC as a reward.")
+        else:
+            print(f"Block mined by {new_block['miner']} is invalid and rejected by the network.")
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from block_header import check_header, check_legacy_block, transactions_root
+from blockstore import BlockStore
+from chain_sync import ChainServer, ChainSync
+
+LEDGER_FILE = "blockchain_ledger.json"  # Whole-ledger JSON, migrated once into the block store
+BLOCK_STORE_FILE = "blockchain_ledger.jsonl"
+DIFFICULTY = 4  # Number of leading zeros required
+HOST = "127.0.0.1"
+PORT = 5300
+
+
+def split_block(block):
+    """A block's header is the block without its transactions.
+
+    Blocks mined before the binary header format hash their whole payload, so
+    they keep their transactions: the hash can't be checked without them.
+    """
+    if "version" not in block:
+        return block
+    return {field: value for field, value in block.items() if field != "transactions"}
+
+
+def check_block_header(header, previous):
+    if "version" in header:
+        try:
+            is_valid = check_header(header, DIFFICULTY)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return False, "Malformed header"
+        if not is_valid:
+            return False, "Header hash mismatch or insufficient proof of work"
+        return True, "Valid header"
+    if previous is not None and "version" in previous:
+        return False, "Legacy block after a header-format block"
+    return check_legacy_block(header, DIFFICULTY)
+
+
+def check_block_body(block):
+    """The transactions must be the ones the already validated header commits to."""
+    if "version" not in block:
+        return check_legacy_block(block, DIFFICULTY)[0]
+    return block["merkle_root"] == transactions_root(block["transactions"])
+
+
+if __name__ == "__main__":
+    # python sync_node.py serve [port]            - serve this node's chain
+    # python sync_node.py sync <port> [<port>...] - catch up from the nodes on those ports
+    if len(sys.argv) < 2 or sys.argv[1] not in ("serve", "sync") or (sys.argv[1] == "sync" and len(sys.argv) < 3):
+        print("Usage: python sync_node.py serve [port] | sync <port> [<port>...]")
+        sys.exit(1)
+
+    store = BlockStore(BLOCK_STORE_FILE, fsync="interval", legacy_json=LEDGER_FILE)
+    if sys.argv[1] == "serve":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+        ChainServer(store, split_block, HOST, port).start()
+    else:
+        peers = [(HOST, int(port)) for port in sys.argv[2:]]
+        before = len(store)
+        try:
+            length = ChainSync(store, peers, split_block, check_block_header, check_block_body).sync()
+        finally:
+            store.close()
+        print(f"Synced {length - before} blocks, chain height {length}")
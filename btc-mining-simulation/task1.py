@@ -1,3 +1,5 @@
+import os
+import sys
 import json
 import hashlib
 import random
@@ -6,8 +8,16 @@ import threading
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import hashes, serialization
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from pow_engine import binary_nonce, search_nonce
+from parallel_mining import mine_parallel
+from block_header import check_header, header_prefix, header_target, new_header, transactions_root
+from blockstore import BlockStore
+from snapshot import SNAPSHOT_INTERVAL
+
 # Constants
-LEDGER_FILE = "blockchain_ledger.json"
+LEDGER_FILE = "blockchain_ledger.json"  # Whole-ledger JSON, migrated once into the block store
+BLOCK_STORE_FILE = "blockchain_ledger.jsonl"
 REWARD = 6.25  # Block reward in BTC
 DIFFICULTY = 4  # Mining difficulty
 
@@ -19,16 +29,22 @@ class BlockchainNode:
 
     def load_blockchain(self):
         """Initialize or load existing blockchain"""
-        try:
-            with open(LEDGER_FILE, "r") as file:
-                self.blockchain = json.load(file)
-        except FileNotFoundError:
-            self.blockchain = []
-
-    def save_blockchain(self):
-        """Save blockchain to file"""
-        with open(LEDGER_FILE, "w") as file:
-            json.dump(self.blockchain, file, indent=4)
+        self.store = BlockStore(BLOCK_STORE_FILE, legacy_json=LEDGER_FILE)
+        self.blockchain = self.store  # Blocks are decoded from the memory-mapped file on access
+
+        # Only the blocks after the last checkpoint are re-checked on startup
+        start = self.store.last_checkpoint() or 0
+        for height in range(start + 1, len(self.store)):
+            if self.store[height]["previous_hash"] != self.store[height - 1]["hash"]:
+                print(f"Warning: block {height} does not link to block {height - 1}")
+        if len(self.store) - start > SNAPSHOT_INTERVAL:
+            self.store.checkpoint(-1)
+
+    def save_blockchain(self, block):
+        """Append a new block to the ledger file"""
+        self.store.append(block)
+        if len(self.store) % SNAPSHOT_INTERVAL == 0:
+            self.store.checkpoint(-1)
 
     @staticmethod
     def generate_keys():
@@ -61,18 +77,25 @@ class BlockchainNode:
         """Calculate SHA256 hash"""
         return hashlib.sha256(block_header.encode()).hexdigest()
 
-    def proof_of_work(self, previous_hash, transactions, difficulty=DIFFICULTY):
-        """Perform proof of work"""
-        nonce = 0
-        while True:
-            block_header = f"{previous_hash}{transactions}{nonce}"
-            block_hash = self.calculate_hash(block_header)
-            if block_hash[:difficulty] == "0" * difficulty:
-                return nonce, block_hash
-            nonce += 1
+    def proof_of_work(self, previous_hash, transactions, difficulty=DIFFICULTY, cancel=None):
+        """Perform proof of work over the binary block header, returns (nonce, hash, header)
+        or None if `cancel` is set before a solution is found"""
+        header = new_header(previous_hash, transactions, difficulty)
+        found = search_nonce(header_prefix(header), header_target(header), cancel=cancel, encode=binary_nonce)
+        if found is None:
+            return None
+        return found[0], found[1], header
 
     def validate_pow(self, block, difficulty=DIFFICULTY):
         """Validate proof of work of a block"""
+        if "version" in block:
+            if block["merkle_root"] != transactions_root(block["transactions"]):
+                return False, "Merkle root doesn't match the block's transactions"
+            if not check_header(block, difficulty):
+                return False, f"Header hash mismatch or doesn't meet difficulty requirement of {difficulty} leading zeros"
+            return True, "Valid PoW"
+
+        # Blocks mined before the binary header format
         previous_hash = block["previous_hash"]
         transactions = f"{block['transactions']['sender']}->{block['transactions']['receiver']}:{block['transactions']['amount']}"
         nonce = block["nonce"]
@@ -88,50 +111,80 @@ class BlockchainNode:
         
         return True, "Valid PoW"
 
-    def mine_block(self, miner_id, previous_hash, transactions, difficulty):
-        """Mine a new block"""
-        # Verify transaction before mining
+    def check_transaction(self, transactions):
+        """Verify the transaction's signature before any miner spends work on it"""
         sender_public_key = alice_public if transactions["sender"] == "Alice" else bob_public
         transaction_data = f"{transactions['sender']}->{transactions['receiver']}:{transactions['amount']}"
-        
-        if not self.verify_signature(sender_public_key, transaction_data, transactions["signature"]):
-            print(f"{miner_id}: Invalid transaction! Rejecting block.")
-            return
-        
-        print(f"{miner_id} is mining...")
-        start_time = time.time()
-        nonce, block_hash = self.proof_of_work(previous_hash, transaction_data, difficulty)
-        end_time = time.time()
-        print(f"{miner_id} found a block! Nonce: {nonce}, Hash: {block_hash} (Time: {end_time - start_time:.2f}s)")
-        
+        return self.verify_signature(sender_public_key, transaction_data, transactions["signature"])
+
+    def record_winner(self, miner_id, header, transactions, nonce, block_hash, time_taken, cancel=None):
+        """Keep the first block found as the competition's result"""
+        print(f"{miner_id} found a block! Nonce: {nonce}, Hash: {block_hash} (Time: {time_taken:.2f}s)")
         with self.lock:
             if "winner" not in self.result:
+                if cancel is not None:
+                    cancel.set()  # Stop the losing miners
                 self.result["winner"] = {
                     "miner": miner_id,
-                    "previous_hash": previous_hash,
+                    **header,
                     "transactions": transactions,
                     "reward": {"miner": miner_id, "amount": REWARD},
                     "nonce": nonce,
                     "hash": block_hash,
-                    "timestamp": time.time()
+                    "time_taken": time_taken
                 }
 
-    def start_mining_competition(self, transaction):
+    def mine_block(self, miner_id, previous_hash, transactions, difficulty, cancel=None):
+        """Mine a new block, giving up as soon as `cancel` is set by the winner"""
+        if not self.check_transaction(transactions):
+            print(f"{miner_id}: Invalid transaction! Rejecting block.")
+            return
+        
+        print(f"{miner_id} is mining...")
+        start_time = time.time()
+        found = self.proof_of_work(previous_hash, transactions, difficulty, cancel)
+        end_time = time.time()
+        if found is None:
+            print(f"{miner_id} stopped mining, another miner already won. (Time: {end_time - start_time:.2f}s)")
+            return
+        nonce, block_hash, header = found
+        self.record_winner(miner_id, header, transactions, nonce, block_hash, end_time - start_time, cancel)
+
+    def mine_block_parallel(self, miners, previous_hash, transactions, difficulty):
+        """Mine a new block with one process per miner, each searching its own nonce ranges"""
+        if not self.check_transaction(transactions):
+            print("Invalid transaction! Rejecting block.")
+            return
+
+        for miner_id in miners:
+            print(f"{miner_id} is mining...")
+        header = new_header(previous_hash, transactions, difficulty)
+        index, nonce, block_hash, time_taken = mine_parallel(
+            header_prefix(header), header_target(header), workers=len(miners), encode=binary_nonce
+        )
+        self.record_winner(miners[index], header, transactions, nonce, block_hash, time_taken)
+
+    def start_mining_competition(self, transaction, backend="processes"):
         """Start mining competition with multiple miners"""
         previous_hash = self.blockchain[-1]["hash"] if self.blockchain else "0" * 64
         miners = ["Miner A", "Miner B", "Miner C", "Miner D", "Miner E", "Miner F"]
-        threads = []
 
-        for miner in miners:
-            thread = threading.Thread(
-                target=self.mine_block,
-                args=(miner, previous_hash, transaction, DIFFICULTY)
-            )
-            threads.append(thread)
-            thread.start()
-
-        for thread in threads:
-            thread.join()
+        if backend == "processes":
+            # Miners split the nonce space across cores instead of sharing one under the GIL
+            self.mine_block_parallel(miners, previous_hash, transaction, DIFFICULTY)
+        else:
+            threads = []
+            cancel = threading.Event()  # Set by the winner of this competition
+            for miner in miners:
+                thread = threading.Thread(
+                    target=self.mine_block,
+                    args=(miner, previous_hash, transaction, DIFFICULTY, cancel)
+                )
+                threads.append(thread)
+                thread.start()
+
+            for thread in threads:
+                thread.join()
 
         # Validate winning block by other nodes
         if "winner" in self.result:
@@ -146,8 +199,7 @@ class BlockchainNode:
                     print(f"{miner}: ❌ Block validation failed - {message}")
 
             # Add block to blockchain if valid
-            self.blockchain.append(winning_block)
-            self.save_blockchain()
+            self.save_blockchain(winning_block)
             print(f"\nBlockchain updated! Transaction confirmed. {winning_block['miner']} received {REWARD} BTC as reward.")
         else:
             print("No valid block was mined.")
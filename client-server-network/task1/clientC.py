@@ -1,29 +1,34 @@
 # clientB.py
+import os
+import sys
 import socket
 import json
 import hashlib
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+
 HOST = '127.0.0.1'
 PORT = 65432
 
 def client_program():
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client_socket.connect((HOST, PORT))
-    client_socket.sendall("B".encode())  # Identify as Client B
+    send_message(client_socket, "B")  # Identify as Client B
 
     # Send Data 2 (example)
     data2 = "Hello, Shahbaz Siddiqui3, NuFAST"
-    client_socket.sendall(json.dumps({
+    send_message(client_socket, {
         "sender": "B",
         "data": data2
-    }).encode())
+    })
 
     # Receive messages from server
+    reader = FrameReader(client_socket)
     while True:
-        response = client_socket.recv(1024).decode()
-        if not response:
+        message = reader.read_message()
+        if message is None:
             break
-        message = json.loads(response)
         print(f"Received from {message['sender']}: {message['data']}")
         # Verify hash
         calculated_hash = hashlib.sha256(json.dumps({
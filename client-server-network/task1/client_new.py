@@ -1,7 +1,12 @@
+import os
+import sys
 import socket
 import hashlib
 import json
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+
 # Blockchain-inspired hashing function
 def hash_message(data):
     message_json = json.dumps(data, sort_keys=True)
@@ -20,17 +25,16 @@ class BlockchainClient:
             "receiver": receiver,
             "content": content
         }
-        self.client.send(json.dumps(message).encode())
+        send_message(self.client, message)
 
     def receive_messages(self):
+        reader = FrameReader(self.client)
         while True:
             try:
-                data = self.client.recv(1024).decode()
-                if not data:
+                message = reader.read_message()
+                if message is None:
                     break
 
-                # Load received message
-                message = json.loads(data)
                 received_hash = message["msg_hash"]
                 content = message["content"]
 
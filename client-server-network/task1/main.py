@@ -1,9 +1,15 @@
 import hashlib
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from compact_block import CompactBlock
 
 class BlockchainMessenger:
     def __init__(self):
         self.chain = []
+        self.positions = {}  # Block hash -> position in the chain
     
     def hash_data(self, data):
         return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
@@ -16,19 +22,18 @@ class BlockchainMessenger:
             "message": message
         }
         message_hash = self.hash_data(data)
-        block = {
+        block = CompactBlock({
             "data": data,
             "hash": message_hash,
             "prev_hash": prev_hash
-        }
+        })
+        self.positions.setdefault(message_hash, len(self.chain))
         self.chain.append(block)
         return block
     
     def get_message_by_hash(self, target_hash):
-        for block in self.chain:
-            if block["hash"] == target_hash:
-                return block
-        return None
+        position = self.positions.get(target_hash)
+        return None if position is None else self.chain[position]
     
     def verify_integrity(self):
         for i in range(1, len(self.chain)):
@@ -39,7 +44,7 @@ class BlockchainMessenger:
     
     def save_messages_to_json(self, filename="messages.json"):
         with open(filename, "w") as file:
-            json.dump(self.chain, file, indent=4)
+            json.dump([block.to_dict() for block in self.chain], file, indent=4)
 
 messenger = BlockchainMessenger()
 
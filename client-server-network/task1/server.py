@@ -1,10 +1,27 @@
+import asyncio
 import hashlib
 import json
+import os
 import socket
+import sys
 import threading
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from blockstore import BlockStore
+from framing import FrameReader, pack_message, read_message_async
+from send_queue import SLOW, AsyncSendQueue, ThreadedSendQueue
+from snapshot import SNAPSHOT_INTERVAL
+from compact_block import pack_hash, unpack_hash
+
+MESSAGES_FILE = "messages.json"  # Whole-chain JSON, migrated once into the block store
+BLOCK_STORE_FILE = "messages.jsonl"
+
 class Block:
+    # No per-instance __dict__; hashes are kept as raw 32-byte digests and
+    # rendered as hex only when read
+    __slots__ = ("index", "data", "timestamp", "_previous_hash", "_hash")
+
     def __init__(self, index, previous_hash, data, timestamp, block_hash=None):
         self.index = index
         self.previous_hash = previous_hash
@@ -12,6 +29,22 @@ class Block:
         self.timestamp = timestamp
         self.hash = block_hash if block_hash else self.calculate_hash()
 
+    @property
+    def previous_hash(self):
+        return unpack_hash(self._previous_hash)
+
+    @previous_hash.setter
+    def previous_hash(self, value):
+        self._previous_hash = pack_hash(value)  # Genesis "0" stays a string
+
+    @property
+    def hash(self):
+        return unpack_hash(self._hash)
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = pack_hash(value)
+
     def calculate_hash(self):
         block_string = json.dumps({
             "index": self.index,
@@ -21,62 +54,108 @@ class Block:
         }, sort_keys=True).encode()
         return hashlib.sha256(block_string).hexdigest()
 
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "data": self.data,
+            "hash": self.hash,
+            "previous_hash": self.previous_hash,
+            "timestamp": self.timestamp
+        }
+
+    @classmethod
+    def from_dict(cls, block_data):
+        return cls(
+            index=block_data["index"],
+            previous_hash=block_data["previous_hash"],
+            data=block_data["data"],
+            timestamp=block_data["timestamp"],
+            block_hash=block_data["hash"]
+        )
+
+class StoredChain:
+    """List-like view of the block store, a Block is only decoded when it is accessed."""
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, height):
+        return Block.from_dict(self.store[height])
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self[height]
+
+    def append(self, block):
+        self.store.append(block.to_dict())
+
+    def find(self, block_hash):
+        block_data = self.store.block_by_hash(block_hash)
+        return Block.from_dict(block_data) if block_data else None
+
 class Blockchain:
     def __init__(self):
-        self.chain = []
+        self.store = BlockStore(BLOCK_STORE_FILE, legacy_json=MESSAGES_FILE)
+        self.lock = threading.Lock()
         self.load_chain_from_json()  # Load existing chain from JSON
+        # Verified-tip watermark: every block up to this height has been checked.
+        # It resumes from the last checkpoint, so a restart only re-verifies the blocks after it
+        self.verified_height = self.store.last_checkpoint() or 0
+        self.verified_hash = self.chain[self.verified_height].hash
+        self.checkpoint_height = self.verified_height
 
     def load_chain_from_json(self):
-        try:
-            with open("messages.json", "r") as f:
-                existing_data = json.load(f)
-                for block_data in existing_data:
-                    block = Block(
-                        index=block_data["index"],
-                        previous_hash=block_data["previous_hash"],
-                        data=block_data["data"],
-                        timestamp=block_data["timestamp"],
-                        block_hash=block_data["hash"]
-                    )
-                    self.chain.append(block)
-                print("Chain loaded from JSON.")
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.chain = [self.create_genesis_block()]
-            self.save_to_json(self.chain[0])
+        # Blocks stay in the memory-mapped file; the height index is all that is loaded
+        self.chain = StoredChain(self.store)
+        if len(self.chain):
+            print("Chain loaded from JSON.")
+        else:
+            self.save_to_json(self.create_genesis_block())
+
+    def get_block_by_hash(self, block_hash):
+        return self.chain.find(block_hash)
 
     def create_genesis_block(self):
         return Block(0, "0", "Genesis Block", datetime.now().isoformat())
 
     def add_block(self, data):
-        previous_block = self.chain[-1]
-        new_block = Block(
-            index=previous_block.index + 1,
-            previous_hash=previous_block.hash,
-            data=data,
-            timestamp=datetime.now().isoformat()
-        )
-        self.chain.append(new_block)
-        self.save_to_json(new_block)
+        with self.lock:
+            previous_block = self.chain[-1]
+            new_block = Block(
+                index=previous_block.index + 1,
+                previous_hash=previous_block.hash,
+                data=data,
+                timestamp=datetime.now().isoformat()
+            )
+            self.save_to_json(new_block)
         return new_block
 
     def save_to_json(self, block):
-        block_data = {
-            "index": block.index,
-            "data": block.data,
-            "hash": block.hash,
-            "previous_hash": block.previous_hash,
-            "timestamp": block.timestamp
-        }
-        try:
-            with open("messages.json", "r") as f:
-                existing_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_data = []
-        existing_data.append(block_data)
-        with open("messages.json", "w") as f:
-            json.dump(existing_data, f, indent=4)
+        # Only the new block is written, whatever the chain length
+        self.chain.append(block)
+
+    def verify_new_blocks(self):
+        """Check only the blocks added since the verified tip, each against its parent"""
+        with self.lock:
+            while self.verified_height + 1 < len(self.chain):
+                current = self.chain[self.verified_height + 1]
+                if current.hash != current.calculate_hash():
+                    print(f"Block {current.index} hash mismatch!")
+                    return False
+                if current.previous_hash != self.verified_hash:
+                    print(f"Block {current.index} previous hash mismatch!")
+                    return False
+                self.verified_height += 1
+                self.verified_hash = current.hash
+            if self.verified_height - self.checkpoint_height >= SNAPSHOT_INTERVAL:
+                self.store.checkpoint(self.verified_height)
+                self.checkpoint_height = self.verified_height
+        return True
 
     def verify_chain(self):
+        """Full audit from genesis, on demand"""
         for i in range(1, len(self.chain)):
             current = self.chain[i]
             previous = self.chain[i-1]
@@ -91,17 +170,32 @@ class Blockchain:
 # Server setup and client handling
 HOST = '127.0.0.1'
 PORT = 65432
-clients = {}
+ASYNC_BACKLOG = 1024  # Pending connections the asyncio server lets queue up
+SLOW_CLIENT_POLICY = "drop"  # Or "disconnect" / "coalesce", see send_queue.py
+clients = {}  # Client id -> ThreadedSendQueue
+async_clients = {}  # Client id -> AsyncSendQueue, for the asyncio server
 blockchain = Blockchain()
 
+def forward(queues, receiver, message, sender):
+    """Queue a message for the receiver without waiting for it to be sent."""
+    queue = queues.get(receiver)
+    if queue is not None and queue.put(pack_message(message), key=sender) == SLOW:
+        print(f"Disconnecting slow client {receiver}")
+        queue.close(abort=True)
+
 def handle_client(conn, addr):
     print(f"Connected by {addr}")
+    reader = FrameReader(conn)  # One frame per message, so clients may send back to back
+    client_id = None
     try:
+        client_id = reader.read_message()
+        if client_id is None:
+            return
+        queue = clients[client_id] = ThreadedSendQueue(conn, policy=SLOW_CLIENT_POLICY)
         while True:
-            data = conn.recv(1024).decode()
-            if not data:
+            message = reader.read_message()
+            if message is None:
                 break
-            message = json.loads(data)
             sender = message['sender']
             content = message['data']
 
@@ -109,22 +203,65 @@ def handle_client(conn, addr):
             print(f"Block #{new_block.index} added: {content}")
             print(f"Hash: {new_block.hash}")
 
-            # Verify chain after adding block
-            is_valid = blockchain.verify_chain()
+            # Verify the new block against the verified tip, not the whole chain
+            is_valid = blockchain.verify_new_blocks()
             print(f"Chain valid: {is_valid}\n")
 
             receiver = 'B' if sender == 'A' else 'A'
-            if receiver in clients:
-                clients[receiver].sendall(json.dumps({
-                    "sender": sender,
-                    "data": content,
-                    "hash": new_block.hash
-                }).encode())
+            forward(clients, receiver, {
+                "sender": sender,
+                "data": content,
+                "hash": new_block.hash
+            }, sender)
     except Exception as e:
         print(f"Error: {e}")
     finally:
+        if client_id is not None and clients.get(client_id) is queue:
+            del clients[client_id]
+            queue.close()
         conn.close()
 
+async def handle_client_async(reader, writer):
+    """Same messages as handle_client, as a coroutine instead of a thread."""
+    addr = writer.get_extra_info("peername")
+    print(f"Connected by {addr}")
+    loop = asyncio.get_running_loop()
+    client_id = None
+    try:
+        client_id = await read_message_async(reader)
+        if client_id is None:
+            return
+        queue = async_clients[client_id] = AsyncSendQueue(writer, policy=SLOW_CLIENT_POLICY)
+        while True:
+            message = await read_message_async(reader)
+            if message is None:
+                break
+            sender = message['sender']
+            content = message['data']
+
+            # Hashing and the disk append run on the executor so the event loop keeps serving
+            new_block = await loop.run_in_executor(None, blockchain.add_block, content)
+            print(f"Block #{new_block.index} added: {content}")
+            print(f"Hash: {new_block.hash}")
+
+            is_valid = await loop.run_in_executor(None, blockchain.verify_new_blocks)
+            print(f"Chain valid: {is_valid}\n")
+
+            # Queued without awaiting the receiver's drain, its own task sends it
+            receiver = 'B' if sender == 'A' else 'A'
+            forward(async_clients, receiver, {
+                "sender": sender,
+                "data": content,
+                "hash": new_block.hash
+            }, sender)
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        if client_id is not None and async_clients.get(client_id) is queue:
+            del async_clients[client_id]
+            queue.close()
+        writer.close()
+
 def start_server():
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.bind((HOST, PORT))
@@ -132,9 +269,21 @@ def start_server():
         print("Server started. Waiting for clients...")
         while True:
             conn, addr = s.accept()
-            client_id = conn.recv(1024).decode()
-            clients[client_id] = conn
+            # The client's first frame is its id, read by its own thread
             threading.Thread(target=handle_client, args=(conn, addr)).start()
 
+def start_async_server():
+    """One event loop thread for every client, so idle connections cost a coroutine, not an OS thread"""
+    async def serve():
+        server = await asyncio.start_server(handle_client_async, HOST, PORT, backlog=ASYNC_BACKLOG)
+        print("Async server started. Waiting for clients...")
+        async with server:
+            await server.serve_forever()
+    asyncio.run(serve())
+
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    # python server.py --asyncio  runs the event loop server instead of thread-per-client
+    if "--asyncio" in sys.argv:
+        start_async_server()
+    else:
+        start_server()
\ No newline at end of file
@@ -1,7 +1,19 @@
+import asyncio
+import os
+import sys
 import socket
 import hashlib
 import json
 import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, pack_message, read_message_async
+from send_queue import SLOW, AsyncSendQueue, ThreadedSendQueue
+
+ASYNC_BACKLOG = 1024  # Pending connections the asyncio server lets queue up
+SLOW_CLIENT_POLICY = "drop"  # Or "disconnect" / "coalesce" (a slow client skips to the latest message of each sender)
+METRICS_INTERVAL = 10  # Seconds between send queue reports with --metrics
 
 # Blockchain-inspired message hashing
 def hash_message(data):
@@ -9,25 +21,50 @@ def hash_message(data):
     return hashlib.sha256(message_json.encode()).hexdigest()
 
 class BlockchainServer:
-    def __init__(self, host="127.0.0.1", port=5000):
+    def __init__(self, host="127.0.0.1", port=5000, policy=SLOW_CLIENT_POLICY):
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.bind((host, port))
         self.server.listen(5)
-        self.clients = {}  # Stores connected clients
+        self.policy = policy
+        self.clients = {}  # addr -> ThreadedSendQueue of each connected client
+        self.lock = threading.Lock()
         self.messages = {}  # Stores message hashes
+        self.writers = {}  # addr -> AsyncSendQueue of each client of the asyncio server
+
+    def relay(self, queues, addr, message, key):
+        """Queue a message for every client but its sender; returns the clients to disconnect."""
+        frame = pack_message(message)  # Encoded once for everyone
+        slow = []
+        for client_addr, queue in queues:
+            if client_addr != addr and queue.put(frame, key=key) == SLOW:
+                slow.append(client_addr)
+        return slow
+
+    def queue_metrics(self):
+        """Depth, drops and coalesced messages of every client's send queue."""
+        with self.lock:
+            queues = list(self.clients.items()) + list(self.writers.items())
+        return {str(addr): queue.metrics() for addr, queue in queues}
+
+    def report_metrics(self):
+        while True:
+            time.sleep(METRICS_INTERVAL)
+            for addr, metrics in self.queue_metrics().items():
+                print(f"📊 {addr}: {metrics}")
 
     def handle_client(self, conn, addr):
         print(f"🔗 Client connected from {addr}")
-        self.clients[addr] = conn
+        with self.lock:
+            self.clients[addr] = ThreadedSendQueue(conn, policy=self.policy)
+        reader = FrameReader(conn)
 
         while True:
             try:
-                data = conn.recv(1024).decode()
-                if not data:
+                # One frame per message, however the stream splits or merges them
+                message = reader.read_message()
+                if message is None:
                     break
 
-                # Load JSON data
-                message = json.loads(data)
                 sender = message["sender"]
                 receiver = message["receiver"]
                 content = message["content"]
@@ -38,18 +75,77 @@ class BlockchainServer:
 
                 print(f"📩 Received from {sender}: {content} (Hash: {msg_hash})")
 
-                # Send message to the intended recipient
-                for client_addr, client_conn in self.clients.items():
-                    if client_addr != addr:  # Send to the other client
-                        client_conn.send(json.dumps({"msg_hash": msg_hash, "content": content}).encode())
+                # Send message to the other clients: only queued, slow ones cannot hold up this loop
+                with self.lock:
+                    queues = list(self.clients.items())
+                for slow_addr in self.relay(queues, addr, {"msg_hash": msg_hash, "content": content}, sender):
+                    print(f"🐢 Disconnecting slow client {slow_addr}")
+                    with self.lock:
+                        queue = self.clients.get(slow_addr)
+                    if queue is not None:
+                        queue.close(abort=True)  # Its own handler sees the connection end and cleans up
 
             except Exception as e:
                 print(f"❌ Error: {e}")
                 break
 
         print(f"🔌 Client {addr} disconnected.")
+        with self.lock:
+            queue = self.clients.pop(addr)
+        queue.close()
         conn.close()
-        del self.clients[addr]
+
+    async def handle_client_async(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        print(f"🔗 Client connected from {addr}")
+        with self.lock:
+            self.writers[addr] = AsyncSendQueue(writer, policy=self.policy)
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                message = await read_message_async(reader)
+                if message is None:
+                    break
+
+                sender = message["sender"]
+                content = message["content"]
+
+                # Hashing runs on the executor so the event loop keeps serving other clients
+                msg_hash = await loop.run_in_executor(None, hash_message, message)
+                self.messages[msg_hash] = message
+
+                print(f"📩 Received from {sender}: {content} (Hash: {msg_hash})")
+
+                # Queued without awaiting any peer's drain, each client's task sends its own queue
+                with self.lock:
+                    queues = list(self.writers.items())
+                for slow_addr in self.relay(queues, addr, {"msg_hash": msg_hash, "content": content}, sender):
+                    print(f"🐢 Disconnecting slow client {slow_addr}")
+                    with self.lock:
+                        queue = self.writers.get(slow_addr)
+                    if queue is not None:
+                        queue.close(abort=True)
+
+            except Exception as e:
+                print(f"❌ Error: {e}")
+                break
+
+        print(f"🔌 Client {addr} disconnected.")
+        with self.lock:
+            queue = self.writers.pop(addr)
+        queue.close()
+        writer.close()
+
+    def start_async(self):
+        """Serve every client from one event loop instead of one thread each."""
+        async def serve():
+            self.server.listen(ASYNC_BACKLOG)  # Room for bursts of new connections
+            server = await asyncio.start_server(self.handle_client_async, sock=self.server)
+            print("🚀 Async server started, waiting for connections...")
+            async with server:
+                await server.serve_forever()
+        asyncio.run(serve())
 
     def start(self):
         print("🚀 Server started, waiting for connections...")
@@ -59,4 +155,12 @@ class BlockchainServer:
 
 # Run the server
 if __name__ == "__main__":
-    BlockchainServer().start()
+    # python server_new.py [--asyncio] [--metrics]
+    #   --asyncio serves clients from an event loop, --metrics reports the send queues periodically
+    server = BlockchainServer()
+    if "--metrics" in sys.argv:
+        threading.Thread(target=server.report_metrics, daemon=True).start()
+    if "--asyncio" in sys.argv:
+        server.start_async()
+    else:
+        server.start()
@@ -1,9 +1,17 @@
 import hashlib
 import json
+import os
 import socket
+import sys
 import threading
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, pack_message, send_message
+from send_queue import SLOW, ThreadedSendQueue
+
+SLOW_CLIENT_POLICY = "drop"  # Or "disconnect" / "coalesce" (copies of the same block are sent once)
+
 # Blockchain Implementation
 class Blockchain:
     def __init__(self):
@@ -66,34 +74,52 @@ class Server:
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.bind((host, port))
         self.server.listen(5)
-        self.clients = []
+        self.clients = {}  # socket -> its ThreadedSendQueue
+        self.lock = threading.Lock()
         self.blockchain = Blockchain()
         print("Server started, waiting for connections...")
 
     def broadcast(self, message, sender):
-        for client in self.clients:
-            if client != sender:
-                try:
-                    client.send(message.encode())
-                except:
-                    self.clients.remove(client)
+        # Encoded once and only queued: each client's own writer sends it, so a slow one delays nobody
+        frame = pack_message(message)
+        with self.lock:
+            clients = list(self.clients.items())
+        for client, queue in clients:
+            # Keyed by block hash: every block of the chain is needed, only a repeat may be coalesced
+            if client != sender and queue.put(frame, key=message["hash"]) == SLOW:
+                print("Disconnecting slow client:", queue.metrics())
+                self.remove_client(client)
+
+    def remove_client(self, client_socket):
+        with self.lock:
+            queue = self.clients.pop(client_socket, None)
+        if queue is not None:
+            queue.close(abort=True)
+
+    def queue_metrics(self):
+        """Queue depth, drops and coalesced messages of every client's send queue."""
+        with self.lock:
+            return {client.fileno(): queue.metrics() for client, queue in self.clients.items()}
 
     def handle_client(self, client_socket):
+        reader = FrameReader(client_socket)
         while True:
             try:
-                message = client_socket.recv(1024).decode()
-                if message:
-                    print("Received:", message)
-                    block = self.blockchain.create_block(message, self.blockchain.chain[-1]["hash"])
-                    self.broadcast(json.dumps(block), client_socket)
+                message = reader.read_message()
+                if message is None:
+                    raise ConnectionError("client disconnected")
+                print("Received:", message)
+                block = self.blockchain.create_block(message, self.blockchain.chain[-1]["hash"])
+                self.broadcast(block, client_socket)
             except:
-                self.clients.remove(client_socket)
+                self.remove_client(client_socket)
                 break
 
     def start(self):
         while True:
             client_socket, addr = self.server.accept()
-            self.clients.append(client_socket)
+            with self.lock:
+                self.clients[client_socket] = ThreadedSendQueue(client_socket, policy=SLOW_CLIENT_POLICY)
             print(f"Client {addr} connected")
             threading.Thread(target=self.handle_client, args=(client_socket,)).start()
 
@@ -105,15 +131,18 @@ class Client:
         threading.Thread(target=self.receive_messages).start()
 
     def receive_messages(self):
+        reader = FrameReader(self.client)
         while True:
             try:
-                message = self.client.recv(1024).decode()
-                print("New Block Received:", message)
+                message = reader.read_message()
+                if message is None:
+                    break
+                print("New Block Received:", json.dumps(message))
             except:
                 break
 
     def send_message(self, message):
-        self.client.send(message.encode())
+        send_message(self.client, message)
 
 # Running the Server
 server = Server()
@@ -132,4 +161,5 @@ client_A.send_message("Hello, Shahbaz Siddiqui2, NuFAST")
 
 # Testing Immutability
 time.sleep(2)
+print("Send queues:", server.queue_metrics())
 server.blockchain.tamper_test()
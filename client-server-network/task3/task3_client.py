@@ -1,17 +1,23 @@
+import os
+import sys
 import socket
-import json
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+
 def client_actions(client_id, actions):
     host = '127.0.0.1'
     port = 65432
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.connect((host, port))
+        # Pipeline every request, then read the responses in order
         for action in actions:
-            s.send(json.dumps(action).encode())
-            data = s.recv(1024).decode()
-            response = json.loads(data)
+            send_message(s, action)
+        reader = FrameReader(s)
+        for _ in actions:
+            response = reader.read_message()
             print(f"Client {client_id} received: {response}")
 
 # Define actions for each client
@@ -29,7 +35,16 @@ user3_actions = [
     {"action": "verify_coin", "coin_id": "coin_1"}
 ]
 
+# A wallet managing several coins uses batch actions, one round trip for all of them
+wallet_coins = [f"wallet_coin_{i}" for i in range(5)]
+user4_actions = [
+    {"action": "create_coins", "items": [{"coin_id": c, "value": 10, "owner": "User4"} for c in wallet_coins]},
+    {"action": "send_coins", "items": [{"coin_id": c, "new_owner": "User1"} for c in wallet_coins]},
+    {"action": "verify_coins", "items": [{"coin_id": c} for c in wallet_coins]}
+]
+
 # Create and start threads for each client
 threading.Thread(target=client_actions, args=("User1", user1_actions)).start()
 threading.Thread(target=client_actions, args=("User2", user2_actions)).start()
 threading.Thread(target=client_actions, args=("User3", user3_actions)).start()
+threading.Thread(target=client_actions, args=("User4", user4_actions)).start()
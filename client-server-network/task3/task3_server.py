@@ -1,9 +1,26 @@
+import os
+import sys
+import json
 import socket
 import threading
-import json
 import hashlib
 import hmac
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+from group_commit import GroupCommitWriter
+from snapshot import SNAPSHOT_INTERVAL, read_snapshot, write_snapshot
+
+SHARDS = 64  # Independent locks in the coin table
+COIN_SNAPSHOT_FILE = "coins.snapshot.json"
+COIN_LOG_WINDOW = 0  # Group commit without waiting: a batch is whatever queued during the last fsync
+
+def coin_signature(coin_id, value, owner):
+    # Symmetric encryption using HMAC
+    message = f"{coin_id}{value}{owner}".encode()
+    secret_key = b'secret_key'  # In practice, this should be securely stored
+    return hmac.new(secret_key, message, hashlib.sha256).hexdigest()
+
 class GoofyCoin:
     def __init__(self, coin_id, value, owner):
         self.coin_id = coin_id
@@ -12,17 +29,11 @@ class GoofyCoin:
         self.signature = self.sign_coin()
 
     def sign_coin(self):
-        # Symmetric encryption using HMAC
-        message = f"{self.coin_id}{self.value}{self.owner}".encode()
-        secret_key = b'secret_key'  # In practice, this should be securely stored
-        return hmac.new(secret_key, message, hashlib.sha256).hexdigest()
+        return coin_signature(self.coin_id, self.value, self.owner)
 
     def verify_coin(self):
         # Verify the coin's signature
-        message = f"{self.coin_id}{self.value}{self.owner}".encode()
-        secret_key = b'secret_key'
-        expected_signature = hmac.new(secret_key, message, hashlib.sha256).hexdigest()
-        return self.signature == expected_signature
+        return self.signature == self.sign_coin()
 
     def to_dict(self):
         return {
@@ -32,60 +43,313 @@ class GoofyCoin:
             "signature": self.signature
         }
 
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a coin with its recorded signature (it is verified when used, not here)."""
+        coin = cls.__new__(cls)
+        coin.coin_id = state["coin_id"]
+        coin.value = state["value"]
+        coin.owner = state["owner"]
+        coin.signature = state["signature"]
+        return coin
+
+def invalid_field(item, fields):
+    """The first of the request's fields that the coin log can't store, or None if they all can."""
+    for field in fields:
+        value = item.get(field)
+        if field == "coin_id" and isinstance(value, (list, dict)):
+            return field  # Also the table's key
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            return field
+    return None
+
+def coin_log_path(generation):
+    return f"coins.wal.{generation}.jsonl"
+
+class CoinLog:
+    """
+    Write-ahead log of the coin table, split into numbered segments.
+
+    Every record is a coin's full state after a create or a transfer, so
+    replaying a record the snapshot already reflects is harmless. Taking a
+    snapshot starts a new segment; only segments from that one on are replayed.
+    """
+
+    def __init__(self, generation, snapshot_every=SNAPSHOT_INTERVAL, on_full=None):
+        self.generation = generation
+        self.snapshot_every = snapshot_every
+        self.on_full = on_full  # Called once a segment holds snapshot_every records
+        self.count = 0
+        self.lock = threading.Lock()
+        self.file = open(coin_log_path(generation), "a")
+
+    def append_batch(self, records):
+        with self.lock:
+            self.file.write("".join(json.dumps(record) + "\n" for record in records))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.count += len(records)
+            full = self.count >= self.snapshot_every
+        if full and self.on_full:
+            self.on_full()
+
+    def rotate(self):
+        """Start the next segment, returns its generation."""
+        with self.lock:
+            self.file.close()
+            self.generation += 1
+            self.count = 0
+            self.file = open(coin_log_path(self.generation), "a")
+            return self.generation
+
+class CoinTable:
+    """
+    Coins spread over SHARDS dicts, each guarded by its own lock.
+
+    Operations on coins in different shards never wait for each other, and the
+    locks are only held for the dict access itself: signing and verifying
+    happen on a copy of the coin's fields, outside any lock. Batches take each
+    shard's lock once, not once per coin.
+    """
+
+    def __init__(self, shards=SHARDS):
+        self.shards = [({}, threading.Lock()) for _ in range(shards)]
+        self.log = None  # GroupCommitWriter; changes are queued to it under the shard lock, keeping their order
+
+    def _record(self, coin, pending):
+        if self.log is not None:
+            pending.append(self.log.submit(coin.to_dict()))
+
+    def _by_shard(self, coin_ids):
+        groups = {}
+        for coin_id in coin_ids:
+            groups.setdefault(hash(coin_id) % len(self.shards), []).append(coin_id)
+        return [(self.shards[index], ids) for index, ids in groups.items()]
+
+    def put_many(self, coins):
+        """Insert the coins, returns their pending log records."""
+        by_id = {coin.coin_id: coin for coin in coins}
+        pending = []
+        for (table, lock), coin_ids in self._by_shard(by_id):
+            with lock:
+                for coin_id in coin_ids:
+                    table[coin_id] = by_id[coin_id]
+                    self._record(by_id[coin_id], pending)
+        return pending
+
+    def read_many(self, coin_ids):
+        """Consistent (value, owner, signature) copies of the coins, None for unknown ones."""
+        states = {}
+        for (table, lock), ids in self._by_shard(set(coin_ids)):
+            with lock:
+                for coin_id in ids:
+                    coin = table.get(coin_id)
+                    states[coin_id] = None if coin is None else (coin.value, coin.owner, coin.signature)
+        return states
+
+    def transfer_many(self, transfers):
+        """
+        Apply {coin_id: (expected_signature, new_owner, new_signature)}, each only
+        if the coin is unchanged since it was read. Returns the ids that changed
+        in the meantime and were left alone, and the pending log records.
+        """
+        conflicts = set()
+        pending = []
+        for (table, lock), coin_ids in self._by_shard(transfers):
+            with lock:
+                for coin_id in coin_ids:
+                    expected_signature, new_owner, new_signature = transfers[coin_id]
+                    coin = table.get(coin_id)
+                    if coin is None or coin.signature != expected_signature:
+                        conflicts.add(coin_id)
+                        continue
+                    coin.owner = new_owner
+                    coin.signature = new_signature
+                    self._record(coin, pending)
+        return conflicts, pending
+
+    def dump(self):
+        """Every coin's state, each shard copied under its lock."""
+        states = []
+        for table, lock in self.shards:
+            with lock:
+                states.extend(coin.to_dict() for coin in table.values())
+        return states
+
 class Server:
     def __init__(self, host='127.0.0.1', port=65432):
         self.host = host
         self.port = port
-        self.coins = {}
-        self.lock = threading.Lock()
+        self.coins = CoinTable()
+        self.snapshotting = threading.Lock()
+        generation = self.recover()
+        self.log = CoinLog(generation, on_full=self.request_snapshot)
+        self.writer = GroupCommitWriter(self.log, window=COIN_LOG_WINDOW)
+        self.coins.log = self.writer
+
+    def recover(self):
+        """Load the last snapshot and replay the log segments written since, returns the newest generation."""
+        snapshot = read_snapshot(COIN_SNAPSHOT_FILE) or {"generation": 0, "coins": []}
+        states = {state["coin_id"]: state for state in snapshot["coins"]}
+        generation = snapshot["generation"]
+        replayed = 0
+        while os.path.exists(coin_log_path(generation)):
+            with open(coin_log_path(generation), "r") as f:
+                for line in f:
+                    try:
+                        state = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A record torn by a crash mid-append
+                    states[state["coin_id"]] = state
+                    replayed += 1
+            if not os.path.exists(coin_log_path(generation + 1)):
+                break
+            generation += 1
+        self.coins.put_many([GoofyCoin.from_dict(state) for state in states.values()])
+        self.remove_old_segments(snapshot["generation"])
+        print(f"Recovered {len(states)} coins ({len(snapshot['coins'])} from snapshot, {replayed} log records)")
+        return generation
+
+    def request_snapshot(self):
+        """Take a snapshot in the background unless one is already running."""
+        if self.snapshotting.acquire(blocking=False):
+            threading.Thread(target=self.snapshot, daemon=True).start()
+
+    def snapshot(self):
+        try:
+            # Changes from here on go to the new segment; the copy below may already
+            # contain some of them, which replaying them again does not change
+            generation = self.log.rotate()
+            write_snapshot(COIN_SNAPSHOT_FILE, {"generation": generation, "coins": self.coins.dump()})
+            self.remove_old_segments(generation)
+        finally:
+            self.snapshotting.release()
+
+    @staticmethod
+    def remove_old_segments(generation):
+        """Delete the log segments a snapshot at `generation` has made redundant."""
+        for name in os.listdir("."):
+            if name.startswith("coins.wal.") and name.endswith(".jsonl"):
+                number = name[len("coins.wal."):-len(".jsonl")]
+                if number.isdigit() and int(number) < generation:
+                    os.remove(name)
+
+    def wait_durable(self, pending):
+        # Outside every shard lock: other clients keep going while this batch is flushed
+        for record in pending:
+            self.writer.wait(record)
+
+    # Batch operations: one result per item, in item order
+    def create_coins(self, items):
+        # Checked before touching the table: a coin that can't be logged must not exist in memory only
+        results = [None] * len(items)
+        coins = []
+        for i, item in enumerate(items):
+            field = invalid_field(item, ("coin_id", "value", "owner"))
+            if field is not None:
+                results[i] = {"status": "error", "message": f"Invalid {field}"}
+                continue
+            coins.append((i, GoofyCoin(item.get("coin_id"), item.get("value"), item.get("owner"))))
+        self.wait_durable(self.coins.put_many([coin for _, coin in coins]))  # Signed before touching the table
+        for i, coin in coins:
+            results[i] = {"status": "success", "coin": coin.to_dict()}
+        return results
+
+    def send_coins(self, items):
+        results = [None] * len(items)
+        pending = []
+        for i, item in enumerate(items):
+            field = invalid_field(item, ("coin_id", "new_owner"))
+            if field is not None:
+                results[i] = {"status": "error", "message": f"Invalid {field}"}
+            else:
+                pending.append(i)
+        while pending:
+            states = self.coins.read_many(items[i].get("coin_id") for i in pending)
+            initial = dict(states)
+            # Play the transfers in order on the copies, so a coin may move several times in one batch
+            for i in pending:
+                coin_id = items[i].get("coin_id")
+                new_owner = items[i].get("new_owner")
+                state = states[coin_id]
+                if state is None:
+                    results[i] = {"status": "error", "message": "Coin not found"}
+                    continue
+                value, owner, signature = state
+                if signature != coin_signature(coin_id, value, owner):
+                    results[i] = {"status": "error", "message": "Invalid coin signature"}
+                    continue
+                states[coin_id] = (value, new_owner, coin_signature(coin_id, value, new_owner))
+                results[i] = {"status": "success", "coin": {
+                    "coin_id": coin_id, "value": value, "owner": new_owner, "signature": states[coin_id][2]
+                }}
+            transfers = {
+                coin_id: (initial[coin_id][2], state[1], state[2])
+                for coin_id, state in states.items() if state != initial[coin_id]
+            }
+            conflicts, logged = self.coins.transfer_many(transfers)
+            self.wait_durable(logged)
+            # Coins another client moved meanwhile are replayed against their new owner
+            pending = [i for i in pending if items[i].get("coin_id") in conflicts]
+        return results
+
+    def verify_coins(self, items):
+        valid = [invalid_field(item, ("coin_id",)) is None for item in items]
+        states = self.coins.read_many(item.get("coin_id") for item, ok in zip(items, valid) if ok)
+        results = []
+        for item, ok in zip(items, valid):
+            coin_id = item.get("coin_id")
+            if not ok:
+                results.append({"status": "error", "message": "Invalid coin_id"})
+                continue
+            state = states[coin_id]
+            if state is None:
+                results.append({"status": "error", "message": "Coin not found"})
+            else:
+                value, owner, signature = state
+                results.append({"status": "success", "is_valid": signature == coin_signature(coin_id, value, owner)})
+        return results
+
+    def create_coin(self, coin_id, value, owner):
+        return self.create_coins([{"coin_id": coin_id, "value": value, "owner": owner}])[0]
+
+    def send_coin(self, coin_id, new_owner):
+        return self.send_coins([{"coin_id": coin_id, "new_owner": new_owner}])[0]
+
+    def verify_coin(self, coin_id):
+        return self.verify_coins([{"coin_id": coin_id}])[0]
 
     def handle_client(self, conn, addr):
         print(f"Connected by {addr}")
+        reader = FrameReader(conn)  # Clients may pipeline requests, each is its own frame
         try:
             while True:
-                data = conn.recv(1024).decode()
-                if not data:
+                request = reader.read_message()
+                if request is None:
                     break
 
-                request = json.loads(data)
                 action = request.get("action")
 
                 if action == "create_coin":
-                    coin_id = request.get("coin_id")
-                    value = request.get("value")
-                    owner = request.get("owner")
-                    coin = GoofyCoin(coin_id, value, owner)
-                    with self.lock:
-                        self.coins[coin_id] = coin
-                    response = {"status": "success", "coin": coin.to_dict()}
-                    conn.send(json.dumps(response).encode())
+                    response = self.create_coin(request.get("coin_id"), request.get("value"), request.get("owner"))
+                    send_message(conn, response)
 
                 elif action == "send_coin":
-                    coin_id = request.get("coin_id")
-                    new_owner = request.get("new_owner")
-                    with self.lock:
-                        if coin_id in self.coins:
-                            coin = self.coins[coin_id]
-                            if coin.verify_coin():
-                                coin.owner = new_owner
-                                coin.signature = coin.sign_coin()
-                                response = {"status": "success", "coin": coin.to_dict()}
-                            else:
-                                response = {"status": "error", "message": "Invalid coin signature"}
-                        else:
-                            response = {"status": "error", "message": "Coin not found"}
-                    conn.send(json.dumps(response).encode())
+                    response = self.send_coin(request.get("coin_id"), request.get("new_owner"))
+                    send_message(conn, response)
 
                 elif action == "verify_coin":
-                    coin_id = request.get("coin_id")
-                    with self.lock:
-                        if coin_id in self.coins:
-                            coin = self.coins[coin_id]
-                            is_valid = coin.verify_coin()
-                            response = {"status": "success", "is_valid": is_valid}
-                        else:
-                            response = {"status": "error", "message": "Coin not found"}
-                    conn.send(json.dumps(response).encode())
+                    response = self.verify_coin(request.get("coin_id"))
+                    send_message(conn, response)
+
+                elif action in ("create_coins", "send_coins", "verify_coins"):
+                    # Batch: {"action": ..., "items": [single-coin requests]} -> one result per item
+                    batch = {"create_coins": self.create_coins, "send_coins": self.send_coins,
+                             "verify_coins": self.verify_coins}[action]
+                    response = {"status": "success", "results": batch(request.get("items", []))}
+                    send_message(conn, response)
 
         finally:
             conn.close()
@@ -0,0 +1,606 @@
+import collections
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+from framing import FrameReader, Peer, encode, send_message
+
+BATCH_SIZE = 256  # Client requests ordered by one agreement round
+BATCH_WINDOW = 0.01  # Seconds the leader waits for more requests before proposing
+WATERMARK = 64  # Batches the leader may have in flight beyond the last executed one
+VIEW_TIMEOUT = 2.0  # Seconds a request may wait before the leader is suspected
+HISTORY = 4096  # Executed batches kept, with their commit certificates, for nodes catching up
+REPLY_CACHE = 100000  # Executed request ids remembered to answer retransmissions
+PUBLIC_KEYS_FILE = "public_keys.json"
+
+# Fields every protocol message must carry, checked before any handler reads them
+VOTE_FIELDS = {"type": str, "view": int, "seq": int, "digest": str, "node": int, "sig": str}
+PREPARED_FIELDS = {"view": int, "seq": int, "digest": str, "batch": list, "proof": list}
+REQUEST_FIELDS = {"client": str, "id": int, "message": str}
+MESSAGE_FIELDS = {
+    "pre-prepare": {"view": int, "seq": int, "digest": str, "batch": list},
+    "prepare": VOTE_FIELDS,
+    "commit": VOTE_FIELDS,
+    "view-change": {"view": int, "executed": int, "executed_proof": list, "prepared": list},
+    "new-view": {"view": int, "view_changes": list},
+    "fetch": {"first": int, "last": int},
+    "batch": {"seq": int, "digest": str, "batch": list, "certificate": list},
+}
+
+
+def quorum_size(f):
+    return 2 * f + 1
+
+
+def generate_keys(directory, n):
+    """Write one private key file per node and the public keys of all of them.
+
+    Each node must only be given its own node<i>.key, plus the public keys file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    public_keys = []
+    for node in range(n):
+        private_key = Ed25519PrivateKey.generate()
+        raw = private_key.private_bytes(serialization.Encoding.Raw, serialization.PrivateFormat.Raw,
+                                        serialization.NoEncryption())
+        fd = os.open(os.path.join(directory, f"node{node}.key"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(raw.hex())
+        public_keys.append(private_key.public_key().public_bytes(serialization.Encoding.Raw,
+                                                                 serialization.PublicFormat.Raw).hex())
+    with open(os.path.join(directory, PUBLIC_KEYS_FILE), "w") as f:
+        json.dump(public_keys, f, indent=4)
+
+
+def load_keys(directory, node):
+    """This node's private key and every node's public key, as written by generate_keys."""
+    with open(os.path.join(directory, f"node{node}.key")) as f:
+        private_key = Ed25519PrivateKey.from_private_bytes(bytes.fromhex(f.read().strip()))
+    with open(os.path.join(directory, PUBLIC_KEYS_FILE)) as f:
+        public_keys = [Ed25519PublicKey.from_public_bytes(bytes.fromhex(key)) for key in json.load(f)]
+    return private_key, public_keys
+
+
+def well_formed(value, fields):
+    return isinstance(value, dict) and all(isinstance(value.get(name), kind) for name, kind in fields.items())
+
+
+def well_formed_message(message):
+    """Check the fields of a protocol message, and of the votes and requests it carries."""
+    fields = MESSAGE_FIELDS.get(message.get("type"))
+    if fields is None or not well_formed(message, dict(fields, node=int, sig=str)):
+        return False
+    requests = message.get("batch", [])
+    votes = message.get("certificate", []) + message.get("executed_proof", [])
+    for prepared in message.get("prepared", []):
+        if not well_formed(prepared, PREPARED_FIELDS):
+            return False
+        requests = requests + prepared["batch"]
+        votes = votes + prepared["proof"]
+    return (all(well_formed(request, REQUEST_FIELDS) for request in requests)
+            and all(well_formed(vote, VOTE_FIELDS) for vote in votes)
+            and all(isinstance(vc, dict) and vc.get("type") == "view-change" and well_formed_message(vc)
+                    for vc in message.get("view_changes", [])))
+
+
+def batch_digest(batch):
+    return hashlib.sha256(encode(batch)).hexdigest()
+
+
+def request_key(request):
+    return (request["client"], request["id"])
+
+
+class Entry:
+    """A batch proposed for a sequence number in a view."""
+
+    def __init__(self, view, seq, digest, batch):
+        self.view = view
+        self.seq = seq
+        self.digest = digest
+        self.batch = batch
+        self.prepared = False
+        self.committed = False
+        self.commit_sent = False
+
+
+class BFTNode:
+    """
+    One replica of the ledger in a leader-based byzantine agreement (PBFT).
+
+    The leader of view v is node v % N. It collects client requests for
+    BATCH_WINDOW seconds (or BATCH_SIZE requests) and orders the whole batch in
+    one round: pre-prepare from the leader, then prepare and commit votes from
+    every node, each round needing 2f + 1 matching votes out of N = 3f + 1. A
+    committed batch is executed in sequence order and each node answers the
+    client, which accepts a result once f + 1 nodes agree on it.
+
+    Nodes that see a request wait longer than VIEW_TIMEOUT suspect the leader
+    and vote for the next view. The new leader's new-view message carries
+    2f + 1 view-change votes, from which every node derives the same batches to
+    re-propose: whatever was prepared since the highest executed batch, and
+    empty batches for the gaps. A node that is behind fetches executed batches
+    with their commit certificates from the others.
+
+    Protocol messages are signed with each node's own key, so votes can be
+    forwarded as proof and no node can speak for another; client requests are
+    trusted to name their client, as with the original servers.
+    """
+
+    def __init__(self, node, nodes, ledger, execute, private_key, public_keys, faulty=False):
+        self.node = node
+        self.private_key = private_key
+        self.public_keys = public_keys  # Indexed by node number
+        self.nodes = nodes  # [(host, port)] of every node, indexed by node number
+        self.n = len(nodes)
+        self.f = (self.n - 1) // 3
+        self.quorum = quorum_size(self.f)
+        self.ledger = ledger  # One record per executed batch
+        self.execute = execute  # Deterministic: request -> result string
+        self.faulty = faulty
+        self.lock = threading.RLock()
+        self.work = threading.Condition(self.lock)
+        self.peers = {i: Peer(address) for i, address in enumerate(nodes) if i != node}
+
+        self.view = 0
+        self.view_changing = None  # View voted for while waiting for its new-view
+        self.view_change_started = 0
+        self.view_changes = collections.defaultdict(dict)  # view -> {node: view-change}
+        self.next_seq = 1  # Leader only
+        self.log = {}  # seq -> Entry, not executed yet
+        self.votes = collections.defaultdict(dict)  # (kind, view, seq) -> {node: vote}
+        self.pending = collections.OrderedDict()  # request key -> (request, first seen)
+        self.proposed = set()  # Request keys in a batch of the current view
+        self.clients = {}  # request key -> connection to answer on
+        self.replies = collections.OrderedDict()  # request key -> result
+        self.history = collections.OrderedDict()  # seq -> (digest, batch, commit certificate)
+        self.executed = 0
+        self.fetching = 0
+        self._recover()
+
+    def _recover(self):
+        """Resume after the last batch in the ledger, remembering the requests it answered."""
+        for record in self.ledger.transactions():
+            self.executed = record["seq"]
+            for request in record["requests"]:
+                self._remember(request_key(request), request["result"])
+        self.next_seq = self.executed + 1
+
+    def _remember(self, key, result):
+        self.replies[key] = result
+        if len(self.replies) > REPLY_CACHE:
+            self.replies.popitem(last=False)
+
+    def sign(self, message):
+        """Add this node's number and signature to a protocol message."""
+        message["node"] = self.node
+        message["sig"] = self.private_key.sign(encode(message)).hex()
+        return message
+
+    def verify(self, message):
+        node = message.get("node")
+        if not isinstance(node, int) or not 0 <= node < len(self.public_keys):
+            return False
+        body = {key: value for key, value in message.items() if key != "sig"}
+        try:
+            self.public_keys[node].verify(bytes.fromhex(message.get("sig", "")), encode(body))
+        except (InvalidSignature, ValueError):
+            return False
+        return True
+
+    def leader(self, view=None):
+        return (self.view if view is None else view) % self.n
+
+    def broadcast(self, message):
+        self.sign(message)
+        for peer in self.peers.values():
+            peer.send(message)
+        self.on_message(message)  # A node counts its own votes
+
+    # Client requests
+
+    def on_request(self, conn, request):
+        key = request_key(request)
+        with self.lock:
+            if self.faulty:
+                self._reply(conn, request, f"[NODE {self.node}] Message rejected and not recorded.")
+                return
+            if key in self.replies:
+                self._reply(conn, request, self.replies[key])  # Retransmission of an executed request
+                return
+            self.clients[key] = conn
+            if key not in self.pending:
+                self.pending[key] = (request, time.monotonic())
+                self.work.notify_all()
+
+    def _reply(self, conn, request, result):
+        try:
+            send_message(conn, {"type": "reply", "id": request["id"], "node": self.node, "result": result})
+        except OSError:
+            pass  # The client retransmits to get its answer
+
+    def _unproposed(self):
+        for key, (request, _) in self.pending.items():
+            if key not in self.proposed:
+                yield key, request
+
+    def propose_loop(self):
+        """Leader: turn queued requests into batches."""
+        while True:
+            with self.work:
+                while not (self.leader() == self.node and self.view_changing is None
+                           and self.next_seq <= self.executed + WATERMARK
+                           and next(self._unproposed(), None) is not None):
+                    self.work.wait(0.5)
+            time.sleep(BATCH_WINDOW)  # Let more requests join the batch
+            with self.lock:
+                if self.leader() != self.node or self.view_changing is not None:
+                    continue
+                batch = []
+                for key, request in self._unproposed():
+                    batch.append(request)
+                    if len(batch) == BATCH_SIZE:
+                        break
+                self.proposed.update(request_key(request) for request in batch)
+                if not batch:
+                    continue
+                seq = self.next_seq
+                self.next_seq += 1
+                self.broadcast({"type": "pre-prepare", "view": self.view, "seq": seq,
+                                "digest": batch_digest(batch), "batch": batch})
+
+    # Agreement
+
+    def on_message(self, message):
+        if self.faulty:
+            return  # Like task2's Server 1, a faulty node takes no part
+        handler = {
+            "pre-prepare": self._on_pre_prepare,
+            "prepare": self._on_vote,
+            "commit": self._on_vote,
+            "view-change": self._on_view_change,
+            "new-view": self._on_new_view,
+            "fetch": self._on_fetch,
+            "batch": self._on_batch,
+        }.get(message.get("type"))
+        if handler is None or not well_formed_message(message) or not self.verify(message):
+            return  # Malformed or forged
+        with self.lock:
+            handler(message)
+
+    def _on_pre_prepare(self, message):
+        view, seq = message["view"], message["seq"]
+        if (view != self.view or self.view_changing is not None or message["node"] != self.leader(view)
+                or not self.executed < seq <= self.executed + WATERMARK
+                or batch_digest(message["batch"]) != message["digest"]):
+            return
+        entry = self.log.get(seq)
+        if entry is not None and entry.view == view:
+            return  # A leader proposing two batches for one number gets one prepare at most
+        self._accept(Entry(view, seq, message["digest"], message["batch"]))
+
+    def _accept(self, entry):
+        """Take a batch for its sequence number and vote to prepare it."""
+        self.log[entry.seq] = entry
+        for request in entry.batch:
+            self.proposed.add(request_key(request))
+        self.broadcast({"type": "prepare", "view": entry.view, "seq": entry.seq, "digest": entry.digest})
+
+    def _on_vote(self, message):
+        if message["seq"] <= self.executed:
+            return
+        self.votes[(message["type"], message["view"], message["seq"])][message["node"]] = message
+        entry = self.log.get(message["seq"])
+        if entry is not None and entry.view == message["view"]:
+            self._advance(entry)
+
+    def _matching(self, kind, entry):
+        votes = self.votes.get((kind, entry.view, entry.seq), {})
+        return [vote for vote in votes.values() if vote["digest"] == entry.digest]
+
+    def _advance(self, entry):
+        if not entry.prepared and len(self._matching("prepare", entry)) >= self.quorum:
+            entry.prepared = True
+        if entry.prepared and not entry.commit_sent:
+            entry.commit_sent = True
+            self.broadcast({"type": "commit", "view": entry.view, "seq": entry.seq, "digest": entry.digest})
+        if entry.prepared and not entry.committed and len(self._matching("commit", entry)) >= self.quorum:
+            entry.committed = True
+            self._execute_ready()
+
+    def _execute_ready(self):
+        """Execute committed batches in sequence order."""
+        while self.executed + 1 in self.log and self.log[self.executed + 1].committed:
+            entry = self.log.pop(self.executed + 1)
+            certificate = self._matching("commit", entry)[:self.quorum]
+            self._execute(entry.seq, entry.digest, entry.batch, certificate)
+
+    def _execute(self, seq, digest, batch, certificate):
+        answered = []
+        results = []
+        for request in batch:
+            key = request_key(request)
+            if key in self.replies:
+                continue  # Ordered twice across a view change, executed once
+            result = self.execute(request, seq)
+            self._remember(key, result)
+            results.append({"client": request["client"], "id": request["id"],
+                            "message": request["message"], "result": result})
+            answered.append((key, request, result))
+        self.ledger.append({"seq": seq, "digest": digest, "requests": results})
+
+        self.executed = seq
+        self.history[seq] = (digest, batch, certificate)
+        if len(self.history) > HISTORY:
+            self.history.popitem(last=False)
+        for kind in ("prepare", "commit"):
+            for view in range(self.view + 1):
+                self.votes.pop((kind, view, seq), None)
+        for key, request, result in answered:
+            self.pending.pop(key, None)
+            self.proposed.discard(key)
+            conn = self.clients.pop(key, None)
+            if conn is not None:
+                self._reply(conn, request, result)
+        self.work.notify_all()
+
+    # View changes
+
+    def timer_loop(self):
+        while True:
+            time.sleep(VIEW_TIMEOUT / 4)
+            with self.lock:
+                if self.faulty:
+                    continue
+                now = time.monotonic()
+                if self.view_changing is not None:
+                    if now - self.view_change_started > 2 * VIEW_TIMEOUT:
+                        self._start_view_change(self.view_changing + 1)  # The next leader failed too
+                elif self.pending and now - next(iter(self.pending.values()))[1] > VIEW_TIMEOUT:
+                    self._start_view_change(self.view + 1)
+                self._fetch_missing()
+
+    def _start_view_change(self, view):
+        print(f"[NODE {self.node}] Suspecting leader {self.leader()}, voting for view {view}")
+        self.view_changing = view
+        self.view_change_started = time.monotonic()
+        for key in self.pending:  # The requests now wait on the new leader
+            request, _ = self.pending[key]
+            self.pending[key] = (request, time.monotonic())
+        prepared = []
+        for entry in self.log.values():
+            if entry.prepared:
+                prepared.append({"view": entry.view, "seq": entry.seq, "digest": entry.digest,
+                                 "batch": entry.batch, "proof": self._matching("prepare", entry)[:self.quorum]})
+        executed_proof = self.history[self.executed][2] if self.executed in self.history else []
+        self.broadcast({"type": "view-change", "view": view, "executed": self.executed,
+                        "executed_proof": executed_proof, "prepared": prepared})
+
+    def _valid_certificate(self, votes, kind, seq, digest):
+        nodes = set()
+        for vote in votes:
+            if (vote.get("type") == kind and vote.get("seq") == seq and vote.get("digest") == digest
+                    and vote.get("view") == votes[0].get("view") and self.verify(vote)):
+                nodes.add(vote["node"])
+        return len(nodes) >= self.quorum
+
+    def _valid_view_change(self, message):
+        executed = message["executed"]
+        if executed > 0:
+            proof = message["executed_proof"]
+            if not proof or not self._valid_certificate(proof, "commit", executed, proof[0].get("digest")):
+                return False
+        for prepared in message["prepared"]:
+            if (prepared["seq"] <= executed or batch_digest(prepared["batch"]) != prepared["digest"]
+                    or not prepared["proof"] or prepared["proof"][0].get("view") != prepared["view"]
+                    or not self._valid_certificate(prepared["proof"], "prepare", prepared["seq"], prepared["digest"])):
+                return False
+        return True
+
+    def _on_view_change(self, message):
+        view = message["view"]
+        if view <= self.view or not self._valid_view_change(message):
+            return
+        self.view_changes[view][message["node"]] = message
+        votes = self.view_changes[view]
+        # f + 1 votes mean at least one honest node suspects the leader: join them
+        if len(votes) > self.f and (self.view_changing is None or self.view_changing < view):
+            self._start_view_change(view)
+        if len(votes) >= self.quorum and self.leader(view) == self.node:
+            self.broadcast({"type": "new-view", "view": view, "view_changes": list(votes.values())[:self.quorum]})
+
+    def _on_new_view(self, message):
+        view = message["view"]
+        view_changes = message["view_changes"]
+        if view <= self.view or message["node"] != self.leader(view):
+            return
+        # Only verified votes count, one per node: the leader may have padded the list
+        verified = {}
+        for vc in view_changes:
+            if (vc.get("type") == "view-change" and vc.get("view") == view and vc["node"] not in verified
+                    and self.verify(vc) and self._valid_view_change(vc)):
+                verified[vc["node"]] = vc
+        if len(verified) < self.quorum:
+            return
+        view_changes = list(verified.values())
+
+        # Every node derives the same proposals from the same view-change votes
+        low = max(vc["executed"] for vc in view_changes)
+        chosen = {}
+        for vc in view_changes:
+            for prepared in vc["prepared"]:
+                seq = prepared["seq"]
+                if seq > low and (seq not in chosen or prepared["view"] > chosen[seq]["view"]):
+                    chosen[seq] = prepared
+        high = max(chosen, default=low)
+
+        print(f"[NODE {self.node}] Entering view {view}, leader {self.leader(view)}")
+        self.view = view
+        self.view_changing = None
+        self.view_changes = collections.defaultdict(dict, {v: c for v, c in self.view_changes.items() if v > view})
+        self.log = {seq: entry for seq, entry in self.log.items() if entry.committed}
+        self.proposed = set()
+        for entry in self.log.values():
+            for request in entry.batch:
+                self.proposed.add(request_key(request))
+        self.next_seq = max(high, self.executed) + 1
+        for seq in range(max(low, self.executed) + 1, high + 1):
+            if seq in self.log:
+                continue
+            batch = chosen[seq]["batch"] if seq in chosen else []  # Nothing can have committed in a gap
+            self._accept(Entry(view, seq, batch_digest(batch), batch))
+        for key in self.pending:
+            request, _ = self.pending[key]
+            self.pending[key] = (request, time.monotonic())
+        self.fetching = max(self.fetching, low)
+        self.work.notify_all()
+
+    # Catching up
+
+    def _fetch_missing(self):
+        """Ask the other nodes for executed batches this node has not seen committed."""
+        known = max([self.fetching] + [seq for (kind, _, seq), votes in self.votes.items()
+                                       if kind == "commit" and len(votes) >= self.quorum])
+        if known > self.executed and not (self.executed + 1 in self.log and self.log[self.executed + 1].committed):
+            message = self.sign({"type": "fetch", "first": self.executed + 1, "last": known})
+            for peer in self.peers.values():
+                peer.send(message)
+
+    def _on_fetch(self, message):
+        peer = self.peers.get(message["node"])
+        if peer is None:
+            return
+        for seq in range(message["first"], min(message["last"], self.executed) + 1):
+            if seq in self.history:
+                digest, batch, certificate = self.history[seq]
+                peer.send(self.sign({"type": "batch", "seq": seq, "digest": digest, "batch": batch,
+                                     "certificate": certificate}))
+
+    def _on_batch(self, message):
+        seq = message["seq"]
+        if (seq <= self.executed or batch_digest(message["batch"]) != message["digest"]
+                or not message["certificate"]
+                or not self._valid_certificate(message["certificate"], "commit", seq, message["digest"])):
+            return
+        # A commit certificate proves the batch is final, whoever sent it
+        entry = Entry(message["certificate"][0]["view"], seq, message["digest"], message["batch"])
+        entry.prepared = entry.committed = entry.commit_sent = True
+        for vote in message["certificate"]:
+            self.votes[("commit", entry.view, seq)][vote["node"]] = vote
+        self.log[seq] = entry
+        self._execute_ready()
+
+    # Networking
+
+    def handle_connection(self, conn):
+        reader = FrameReader(conn)
+        try:
+            while True:
+                message = reader.read_message()
+                if message is None:
+                    break
+                if not isinstance(message, dict):
+                    continue
+                if message.get("type") == "request":
+                    if well_formed(message, REQUEST_FIELDS):
+                        self.on_request(conn, message)
+                else:
+                    self.on_message(message)
+        finally:
+            conn.close()
+
+    def start(self):
+        threading.Thread(target=self.propose_loop, daemon=True).start()
+        threading.Thread(target=self.timer_loop, daemon=True).start()
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(self.nodes[self.node])
+        server.listen()
+        role = "faulty node" if self.faulty else f"node of {self.n} (f = {self.f})"
+        print(f"[NODE {self.node}] Listening on {self.nodes[self.node]} as {role}, executed #{self.executed}")
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+
+class BFTClient:
+    """
+    Sends requests to every node and waits for f + 1 matching replies, so a
+    result vouched for by at least one honest node. Requests are pipelined and
+    retransmitted to all nodes if no answer arrives within VIEW_TIMEOUT.
+    """
+
+    def __init__(self, name, nodes):
+        self.name = name
+        self.nodes = nodes
+        self.f = (len(nodes) - 1) // 3
+        self.next_id = time.time_ns()  # Unique across runs: nodes remember executed ids
+        self.replies = {}  # id -> {node: result}, for requests still waiting
+        self.done = threading.Condition()
+        self.conns = [None] * len(nodes)
+
+    def _connection(self, index):
+        if self.conns[index] is None:
+            conn = socket.create_connection(self.nodes[index])
+            self.conns[index] = conn
+            threading.Thread(target=self._read_replies, args=(conn,), daemon=True).start()
+        return self.conns[index]
+
+    def _read_replies(self, conn):
+        reader = FrameReader(conn)
+        while True:
+            reply = reader.read_message()
+            if reply is None:
+                return
+            with self.done:
+                if reply["id"] in self.replies:
+                    self.replies[reply["id"]][reply["node"]] = reply["result"]
+                    self.done.notify_all()
+
+    def _send(self, requests):
+        for index in range(len(self.nodes)):
+            try:
+                conn = self._connection(index)
+                for request in requests:
+                    send_message(conn, request)
+            except OSError:
+                self.conns[index] = None  # Down or faulty: f of them are tolerated
+
+    def _result(self, request_id):
+        counts = collections.Counter(self.replies[request_id].values())
+        for result, count in counts.items():
+            if count > self.f:
+                return result
+        return None
+
+    def submit_many(self, messages):
+        """Order the messages through the nodes, returns the committed result of each."""
+        requests = []
+        for message in messages:
+            requests.append({"type": "request", "client": self.name, "id": self.next_id, "message": message})
+            self.next_id += 1
+        with self.done:
+            for request in requests:
+                self.replies[request["id"]] = {}
+        self._send(requests)
+        results = {}
+        with self.done:
+            while len(results) < len(requests):
+                for request in requests:
+                    if request["id"] not in results:
+                        result = self._result(request["id"])
+                        if result is not None:
+                            results[request["id"]] = result
+                            self.replies.pop(request["id"])
+                if len(results) < len(requests) and not self.done.wait(VIEW_TIMEOUT):
+                    self._send([request for request in requests if request["id"] not in results])
+        return [results[request["id"]] for request in requests]
+
+    def submit(self, message):
+        return self.submit_many([message])[0]
@@ -0,0 +1,240 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from json_stream import JSONStream
+from snapshot import read_snapshot, write_snapshot
+
+# When appended records are forced to disk:
+#   "always"   - fsync after every append (survives power loss, slowest)
+#   "interval" - fsync at most once every FSYNC_INTERVAL seconds
+#   "never"    - flush to the OS only, it decides when to write
+FSYNC_POLICIES = ("always", "interval", "never")
+FSYNC_INTERVAL = 1.0
+
+# Sidecar index entry, one per height: byte offset of the record and its raw 32-byte hash
+INDEX_ENTRY = struct.Struct(">Q32s")
+NO_HASH = b"\x00" * 32
+
+
+def migrate_json(json_path, store_path):
+    """
+    One-time conversion of a JSON array ledger into a JSON Lines block store.
+
+    The array is streamed a block at a time, so a large legacy ledger is never
+    held in memory whole; a damaged file keeps the blocks before the damage.
+    """
+    count = 0
+    tmp_path = store_path + ".tmp"
+    with open(json_path, "r") as src, open(tmp_path, "wb") as f:
+        stream = JSONStream(src)
+        if stream.peek() == "[":
+            try:
+                for block in stream.items():
+                    f.write(json.dumps(block).encode() + b"\n")
+                    count += 1
+            except ValueError:
+                print(f"{json_path} is damaged after block {count}, migrating the blocks before it")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, store_path)  # Atomic, a crash never leaves a half-migrated store
+    print(f"Migrated {count} blocks from {json_path} to {store_path}")
+
+
+class BlockStore:
+    """
+    Append-only block store: one JSON-encoded block per line.
+
+    Appending writes only the new record, so its cost does not depend on the
+    chain length, unlike re-dumping the whole ledger with json.dump.
+
+    The block file is memory-mapped and a sidecar `<path>.idx` maps every height
+    to its record offset and hash, so store[height] and block_by_hash() read
+    one record without parsing the rest of the chain.
+    """
+
+    def __init__(self, path, fsync="always", legacy_json=None, hash_field="hash"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.path = path
+        self.index_path = path + ".idx"
+        self.snapshot_path = path + ".snapshot"
+        self.fsync = fsync
+        self.hash_field = hash_field
+        self.lock = threading.Lock()
+        self.last_sync = time.monotonic()
+
+        if not os.path.exists(path) and legacy_json and os.path.exists(legacy_json):
+            migrate_json(legacy_json, path)
+        self._drop_torn_tail()
+        self.file = open(path, "ab")
+        self.size = self.file.seek(0, os.SEEK_END)
+        self.reader = open(path, "rb")
+        self.map = None
+        self._load_index()
+        self.index_file = open(self.index_path, "ab")
+
+    def _drop_torn_tail(self):
+        """Cut off a last record left incomplete by a crash mid-append."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Walk back to the end of the last complete record
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+            f.truncate(pos)
+
+    def _hash_of(self, block):
+        value = block.get(self.hash_field) if isinstance(block, dict) else None
+        try:
+            digest = bytes.fromhex(value)
+        except (TypeError, ValueError):
+            return NO_HASH
+        return digest if len(digest) == 32 else NO_HASH
+
+    def _load_index(self):
+        """Read the sidecar index, then index any records it is missing (first open or crash)."""
+        self.offsets = array("Q")  # Height -> record offset
+        self.heights = {}  # Raw hash -> height
+        data = b""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        data = data[:len(data) - len(data) % INDEX_ENTRY.size]
+        for height, (offset, digest) in enumerate(INDEX_ENTRY.iter_unpack(data)):
+            if offset >= self.size:
+                break  # Points past a record that was trimmed as torn
+            self.offsets.append(offset)
+            if digest != NO_HASH:
+                self.heights[digest] = height
+
+        entries = []
+        with open(self.path, "rb") as f:
+            if self.offsets:
+                f.seek(self.offsets[-1])
+                f.readline()  # Skip the last indexed record
+            offset = f.tell()
+            for line in f:
+                if line.strip():
+                    digest = self._hash_of(json.loads(line))
+                    if digest != NO_HASH:
+                        self.heights[digest] = len(self.offsets)
+                    self.offsets.append(offset)
+                    entries.append(INDEX_ENTRY.pack(offset, digest))
+                offset += len(line)
+
+        with open(self.index_path, "ab") as f:
+            f.truncate((len(self.offsets) - len(entries)) * INDEX_ENTRY.size)
+            f.write(b"".join(entries))
+
+    def _view(self):
+        """The memory map of the block file, remapped when appends have grown it."""
+        if self.map is None or len(self.map) < self.size:
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.reader.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def append(self, block):
+        record = json.dumps(block).encode() + b"\n"
+        with self.lock:
+            offset = self.size
+            self.file.write(record)
+            self.file.flush()
+            self._sync()
+            self.size += len(record)
+            # The index is rebuilt from the block file if lost, so it is never fsynced
+            digest = self._hash_of(block)
+            self.index_file.write(INDEX_ENTRY.pack(offset, digest))
+            self.index_file.flush()
+            if digest != NO_HASH:
+                self.heights[digest] = len(self.offsets)
+            self.offsets.append(offset)
+
+    def _sync(self):
+        if self.fsync == "always":
+            os.fsync(self.file.fileno())
+        elif self.fsync == "interval" and time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+            os.fsync(self.file.fileno())
+            self.last_sync = time.monotonic()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, height):
+        """Decode only the block at `height` (negative heights count from the tip)."""
+        with self.lock:
+            if height < 0:
+                height += len(self.offsets)
+            if not 0 <= height < len(self.offsets):
+                raise IndexError("block height out of range")
+            start = self.offsets[height]
+            end = self.offsets[height + 1] if height + 1 < len(self.offsets) else self.size
+            return json.loads(self._view()[start:end])
+
+    def __iter__(self):
+        return self.blocks()
+
+    def blocks(self, start=0):
+        """Generator over the blocks from height `start` on, decoded one at a time."""
+        for height in range(start, len(self)):
+            yield self[height]
+
+    def block_by_hash(self, block_hash):
+        """Return the block with this hex hash, or None."""
+        try:
+            height = self.heights.get(bytes.fromhex(block_hash))
+        except ValueError:
+            return None
+        return None if height is None else self[height]
+
+    def checkpoint(self, height):
+        """
+        Record that the chain up to `height` has been processed, so a restart
+        resumes from there instead of from genesis.
+        """
+        if height < 0:
+            height += len(self)
+        write_snapshot(self.snapshot_path, {"height": height, "hash": self[height].get(self.hash_field)})
+
+    def last_checkpoint(self):
+        """Height of the last checkpoint, or None if there is none or the chain no longer matches it."""
+        snapshot = read_snapshot(self.snapshot_path)
+        if not snapshot or snapshot["height"] >= len(self):
+            return None
+        if self[snapshot["height"]].get(self.hash_field) != snapshot["hash"]:
+            return None  # The block file was replaced since
+        return snapshot["height"]
+
+    def load(self):
+        """Return every stored block as a list."""
+        return list(self)
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            if self.fsync != "never":
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.index_file.close()
+            if self.map is not None:
+                self.map.close()
+            self.reader.close()
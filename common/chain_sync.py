@@ -0,0 +1,223 @@
+import heapq
+import socket
+import threading
+
+from blockstore import BlockStore
+from framing import FrameReader, send_message
+
+HEADERS_BATCH = 2000  # Headers per request
+BODY_BATCH = 64  # Blocks per request
+WINDOW = 32  # Body batches fetched ahead of the next one to append, bounds memory
+CONNECTIONS_PER_PEER = 2  # Parallel body downloads from each peer
+
+
+class ChainServer:
+    """
+    Serves a BlockStore to syncing nodes over framed messages:
+    {"type": "tip"}, {"type": "getheaders", "start", "count"} and
+    {"type": "getblocks", "start", "count"}. `split` turns a block into its
+    header (the block without its body).
+    """
+
+    def __init__(self, store, split, host="127.0.0.1", port=5300):
+        self.store = store
+        self.split = split
+        self.address = (host, port)
+
+    def handle_connection(self, conn):
+        reader = FrameReader(conn)
+        try:
+            while True:
+                request = reader.read_message()
+                if request is None:
+                    break
+                kind = request.get("type")
+                if kind == "tip":
+                    length = len(self.store)
+                    send_message(conn, {"length": length, "hash": self.store[-1]["hash"] if length else None})
+                elif kind in ("getheaders", "getblocks"):
+                    end = min(request["start"] + request["count"], len(self.store))
+                    blocks = [self.store[height] for height in range(request["start"], end)]
+                    if kind == "getheaders":
+                        send_message(conn, {"headers": [self.split(block) for block in blocks]})
+                    else:
+                        send_message(conn, {"blocks": blocks})
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def start(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(self.address)
+        server.listen()
+        print(f"Serving {len(self.store)} blocks on {self.address[0]}:{self.address[1]}")
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+
+class ChainSync:
+    """
+    Headers-first synchronization of a BlockStore from peers.
+
+    1. The header chain is downloaded from the peer with the longest chain and
+       every header is checked (link to its parent, `check_header` for the
+       proof of work) before any body is fetched, so a bad chain is rejected
+       after a few bytes per block and the next longest one is tried.
+    2. The bodies are fetched in batches from every peer at once, each matched
+       against its already validated header (`check_body`), and appended to
+       the store in height order.
+
+    Validated headers are kept in their own store next to the block store, so
+    an interrupted sync resumes where it stopped: neither the headers nor the
+    blocks already stored are fetched again.
+    """
+
+    def __init__(self, store, peers, split, check_header, check_body, genesis_previous="0" * 64):
+        self.store = store
+        self.peers = peers
+        self.split = split
+        self.check_header = check_header  # (header, parent header or None) -> (is_valid, message)
+        self.check_body = check_body  # block -> is_valid, the block's header already checked
+        self.genesis_previous = genesis_previous
+        self.headers = BlockStore(store.path + ".headers", fsync="interval")
+        self.cond = threading.Condition()
+
+    def _seed_headers(self):
+        """Headers of blocks the node already has, and a check that both stores describe one chain."""
+        for height in range(len(self.headers), len(self.store)):
+            self.headers.append(self.split(self.store[height]))
+        if len(self.store) and self.headers[len(self.store) - 1]["hash"] != self.store[-1]["hash"]:
+            raise ValueError(f"{self.headers.path} is from another chain, delete it to sync again")
+
+    def _tips(self):
+        tips = {}
+        for peer in self.peers:
+            try:
+                with socket.create_connection(peer, timeout=5) as conn:
+                    send_message(conn, {"type": "tip"})
+                    tip = FrameReader(conn).read_message()
+                if tip is not None:
+                    tips[peer] = tip["length"]
+            except OSError as e:
+                print(f"Peer {peer} unreachable: {e}")
+        return tips
+
+    def sync(self):
+        """Bring the store up to the longest peer chain, returns the new length."""
+        self._seed_headers()
+        tips = self._tips()
+        if not tips:
+            raise ConnectionError("No peer reachable")
+        # Longest chain first; a chain with an invalid header is dropped for the next one
+        for peer in sorted(tips, key=tips.get, reverse=True):
+            if tips[peer] <= len(self.headers):
+                break
+            try:
+                self._download_headers(peer, tips[peer])
+                break
+            except (OSError, ValueError) as e:
+                print(f"Header chain from {peer} rejected: {e}")
+        if len(self.headers) > len(self.store):
+            peers = [peer for peer, length in tips.items() if length >= len(self.headers)]
+            self._download_bodies(peers)
+        return len(self.store)
+
+    def _download_headers(self, peer, length):
+        print(f"Downloading headers {len(self.headers)}..{length - 1} from {peer}")
+        with socket.create_connection(peer) as conn:
+            reader = FrameReader(conn)
+            while len(self.headers) < length:
+                start = len(self.headers)
+                send_message(conn, {"type": "getheaders", "start": start,
+                                    "count": min(HEADERS_BATCH, length - start)})
+                reply = reader.read_message()
+                if reply is None or not reply["headers"]:
+                    raise ConnectionError(f"{peer} stopped sending headers at height {start}")
+                previous = self.headers[-1] if len(self.headers) else None
+                for height, header in enumerate(reply["headers"], start):
+                    expected = previous["hash"] if previous else self.genesis_previous
+                    if header["previous_hash"] != expected:
+                        raise ValueError(f"Header {height} from {peer} does not link to header {height - 1}")
+                    is_valid, message = self.check_header(header, previous)
+                    if not is_valid:
+                        raise ValueError(f"Header {height} from {peer} is invalid: {message}")
+                    self.headers.append(header)
+                    previous = header
+        print(f"Header chain of {len(self.headers)} blocks validated")
+
+    def _matches(self, height, block):
+        return self.split(block) == self.headers[height] and self.check_body(block)
+
+    def _download_bodies(self, peers):
+        total = len(self.headers)
+        print(f"Downloading blocks {len(self.store)}..{total - 1} from {len(peers)} peers")
+        self.todo = list(range(len(self.store), total, BODY_BATCH))  # Heap of batch start heights
+        self.in_flight = 0
+        self.fetched = {}  # start -> blocks, waiting for the batches before them
+        self.dropped = set()  # Peers that sent a bad batch, on any of their connections
+        self.workers = len(peers) * CONNECTIONS_PER_PEER
+        for peer in peers:
+            for _ in range(CONNECTIONS_PER_PEER):
+                threading.Thread(target=self._body_worker, args=(peer, total), daemon=True).start()
+
+        with self.cond:
+            while len(self.store) < total:
+                start = len(self.store)
+                if start in self.fetched:
+                    for block in self.fetched.pop(start):
+                        self.store.append(block)
+                    self.cond.notify_all()  # Moves the window
+                elif self.workers == 0:
+                    raise ConnectionError(f"No peer left to fetch block {start}; run again to resume")
+                else:
+                    self.cond.wait()
+
+    def _next_batch(self):
+        """Lowest batch not fetched yet within the window, or None once there is nothing left."""
+        with self.cond:
+            while True:
+                if self.todo and self.todo[0] < len(self.store) + WINDOW * BODY_BATCH:
+                    self.in_flight += 1
+                    return heapq.heappop(self.todo)
+                if not self.todo and self.in_flight == 0:
+                    return None
+                self.cond.wait()
+
+    def _body_worker(self, peer, total):
+        try:
+            conn = socket.create_connection(peer)
+            reader = FrameReader(conn)
+        except OSError:
+            conn = None
+        try:
+            while conn is not None and peer not in self.dropped:
+                start = self._next_batch()
+                if start is None:
+                    break
+                count = min(BODY_BATCH, total - start)
+                try:
+                    send_message(conn, {"type": "getblocks", "start": start, "count": count})
+                    reply = reader.read_message()
+                except OSError:
+                    reply = None
+                blocks = reply["blocks"] if reply else []
+                valid = len(blocks) == count and all(self._matches(start + i, block) for i, block in enumerate(blocks))
+                with self.cond:
+                    self.in_flight -= 1
+                    if valid:
+                        self.fetched[start] = blocks
+                    else:
+                        heapq.heappush(self.todo, start)  # Someone else fetches it
+                        if peer not in self.dropped:
+                            self.dropped.add(peer)
+                            print(f"Dropping peer {peer}: bad or missing blocks {start}..{start + count - 1}")
+                    self.cond.notify_all()
+        finally:
+            if conn is not None:
+                conn.close()
+            with self.cond:
+                self.workers -= 1
+                self.cond.notify_all()
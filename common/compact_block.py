@@ -0,0 +1,79 @@
+import re
+import sys
+from collections.abc import Mapping
+
+HASH_FIELDS = frozenset(("hash", "previous_hash", "prev_hash", "merkle_root", "signature_hash"))
+NAME_FIELDS = frozenset(("sender", "receiver", "miner", "node", "client"))
+
+_shapes = {}  # Field-name tuple -> the one shared instance of it
+_HASH = re.compile(r"[0-9a-f]{64}")  # As in framing: only what unpack_hash renders back identically
+
+
+def pack_hash(value):
+    """A 64-char lowercase hex hash as its 32 raw bytes; anything else (e.g. genesis "0") unchanged."""
+    if isinstance(value, str) and len(value) == 64 and _HASH.fullmatch(value):
+        return bytes.fromhex(value)
+    return value
+
+
+def unpack_hash(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def intern_names(value):
+    """Intern sender/receiver-style names at any depth so repeated names share one string."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in NAME_FIELDS and isinstance(item, str):
+                value[key] = sys.intern(item)
+            else:
+                intern_names(item)
+    elif isinstance(value, list):
+        for item in value:
+            intern_names(item)
+    return value
+
+
+class CompactBlock(Mapping):
+    """
+    Memory-compact, dict-compatible block record.
+
+    Field names are shared between every block of the same shape and values live
+    in a tuple, hash fields are held as raw 32-byte digests and rendered as hex
+    only when read, and names are interned. Code reading block["hash"] or
+    block["transactions"]["sender"] works unchanged.
+
+    Blocks are read-only: to change a field, build a new block, e.g.
+    CompactBlock({**block.to_dict(), "hash": new_hash}).
+    """
+    __slots__ = ("_keys", "_values")
+
+    def __init__(self, block):
+        keys = tuple(block)
+        self._keys = _shapes.setdefault(keys, keys)
+        self._values = tuple(
+            pack_hash(value) if key in HASH_FIELDS
+            else sys.intern(value) if key in NAME_FIELDS and isinstance(value, str)
+            else intern_names(value)
+            for key, value in block.items()
+        )
+
+    def __getitem__(self, key):
+        try:
+            value = self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+        return unpack_hash(value) if key in HASH_FIELDS else value
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(self.to_dict())  # Prints like the dict it replaces
+
+    def to_dict(self):
+        """Plain dict for JSON serialization."""
+        return {key: self[key] for key in self._keys}
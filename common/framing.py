@@ -0,0 +1,260 @@
+import asyncio
+import queue
+import re
+import socket
+import struct
+import threading
+import time
+
+# Every frame is a 4-byte big-endian payload length followed by the payload
+HEADER = struct.Struct(">I")
+MAX_FRAME = 16 << 20  # Larger lengths mean a corrupt or hostile stream
+BUFFER_SIZE = 64 * 1024
+
+_FLOAT = struct.Struct(">d")
+_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+class FrameReader:
+    """
+    Reads length-prefixed frames from a socket.
+
+    recv_into fills one preallocated buffer and every complete frame in it is
+    returned before the socket is read again, so messages sent back to back are
+    never merged and large ones are never truncated. The buffer only grows for
+    a frame bigger than it.
+    """
+
+    def __init__(self, sock, buffer_size=BUFFER_SIZE):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte not returned yet
+        self.end = 0  # End of the received bytes
+
+    def _next_frame(self):
+        """Take a complete frame out of the buffer, or return None."""
+        available = self.end - self.start
+        if available < HEADER.size:
+            return None
+        (length,) = HEADER.unpack_from(self.buffer, self.start)
+        if length > MAX_FRAME:
+            raise ValueError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+        if available < HEADER.size + length:
+            return None
+        begin = self.start + HEADER.size
+        self.start = begin + length
+        return bytes(self.view[begin:self.start])
+
+    def _make_room(self):
+        """Move the partial frame to the front of the buffer, growing it if the frame does not fit."""
+        pending = self.end - self.start
+        needed = pending + 1
+        if pending >= HEADER.size:
+            needed = HEADER.size + HEADER.unpack_from(self.buffer, self.start)[0]
+        if needed > len(self.buffer):
+            buffer = bytearray(max(needed, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.view.release()
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        else:
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+        self.start, self.end = 0, pending
+
+    def read_frame(self):
+        """The next frame's payload, or None once the peer has closed (or reset) the connection."""
+        while True:
+            frame = self._next_frame()
+            if frame is not None:
+                return frame
+            if self.start == self.end:
+                self.start = self.end = 0
+            elif self.end == len(self.buffer):
+                self._make_room()
+            try:
+                received = self.sock.recv_into(self.view[self.end:])
+            except ConnectionResetError:
+                return None  # The peer went away, same as a clean close
+            if received == 0:
+                return None
+            self.end += received
+
+    def read_message(self):
+        """The next frame decoded with decode(), or None once the peer has closed the connection."""
+        frame = self.read_frame()
+        return None if frame is None else decode(frame)
+
+
+def send_frame(sock, payload):
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def send_message(sock, value):
+    send_frame(sock, encode(value))
+
+
+def pack_message(value):
+    """A message framed and ready to write, e.g. to encode a broadcast once for every client."""
+    payload = encode(value)
+    return HEADER.pack(len(payload)) + payload
+
+
+class Peer:
+    """Outgoing connection to another node; messages are queued and sent in order by one thread."""
+
+    def __init__(self, address):
+        self.address = address
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def send(self, message):
+        self.queue.put(message)
+
+    def close(self):
+        """Stop once the messages already queued are sent."""
+        self.queue.put(None)
+
+    def _run(self):
+        message = self.queue.get()
+        while message is not None:
+            try:
+                conn = socket.create_connection(self.address)
+            except OSError:
+                time.sleep(0.5)  # Queued messages wait for the node to come up
+                continue
+            try:
+                while message is not None:
+                    send_message(conn, message)
+                    message = self.queue.get()
+            except OSError:
+                pass  # The unsent message is retried on the next connection
+            conn.close()
+
+
+async def read_message_async(stream):
+    """asyncio counterpart of FrameReader.read_message for a StreamReader."""
+    try:
+        (length,) = HEADER.unpack(await stream.readexactly(HEADER.size))
+        if length > MAX_FRAME:
+            raise ValueError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+        return decode(await stream.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        return None
+
+
+def write_message(writer, value):
+    """Queue a framed message on a StreamWriter; await writer.drain() to wait for the socket."""
+    writer.write(pack_message(value))
+
+
+# Compact binary codec for JSON-like values. Each value is a one-byte tag then
+# its body; integers are zigzag varints and 64-char lowercase hex hashes are
+# sent as their 32 raw bytes.
+def _varint(n, out):
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _encode(value, out):
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    elif isinstance(value, int):
+        out += b"I"
+        _varint(value * 2 if value >= 0 else -value * 2 - 1, out)
+    elif isinstance(value, float):
+        out += b"D"
+        out += _FLOAT.pack(value)
+    elif isinstance(value, str):
+        if len(value) == 64 and _HASH.fullmatch(value):
+            out += b"H"
+            out += bytes.fromhex(value)
+        else:
+            data = value.encode()
+            out += b"S"
+            _varint(len(data), out)
+            out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out += b"B"
+        _varint(len(value), out)
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out += b"L"
+        _varint(len(value), out)
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out += b"M"
+        _varint(len(value), out)
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def encode(value):
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _decode(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == 0x4E:  # N
+        return None, pos
+    if tag == 0x54:  # T
+        return True, pos
+    if tag == 0x46:  # F
+        return False, pos
+    if tag == 0x49:  # I
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if tag == 0x44:  # D
+        return _FLOAT.unpack_from(data, pos)[0], pos + 8
+    if tag == 0x48:  # H
+        return data[pos:pos + 32].hex(), pos + 32
+    if tag in (0x53, 0x42):  # S, B
+        length, pos = _read_varint(data, pos)
+        body = data[pos:pos + length]
+        return (body.decode() if tag == 0x53 else bytes(body)), pos + length
+    if tag == 0x4C:  # L
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == 0x4D:  # M
+        count, pos = _read_varint(data, pos)
+        mapping = {}
+        for _ in range(count):
+            key, pos = _decode(data, pos)
+            mapping[key], pos = _decode(data, pos)
+        return mapping, pos
+    raise ValueError(f"Unknown tag {tag:#x} at offset {pos - 1}")
+
+
+def decode(data):
+    value, pos = _decode(data, 0)
+    if pos != len(data):
+        raise ValueError("Trailing bytes after the encoded value")
+    return value
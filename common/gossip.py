@@ -0,0 +1,188 @@
+import collections
+import hashlib
+import math
+import random
+import socket
+import threading
+import time
+
+from framing import FrameReader, Peer, decode, encode
+
+GOSSIP_INTERVAL = 0.01  # Seconds announcements are held to share a frame with later ones
+ANTI_ENTROPY_INTERVAL = 0.5  # Seconds between re-announcements of recent items to one random peer
+RECENT_WINDOW = 2.0  # Seconds an item keeps being re-announced
+REQUEST_TIMEOUT = 1.0  # Seconds before an item asked for is asked for again
+MAX_ITEMS = 100000  # Items kept to answer getdata requests
+
+
+def item_hash(item):
+    return hashlib.sha256(encode(item)).hexdigest()
+
+
+def default_fanout(peer_count):
+    """Peers each new item is announced to: enough for the epidemic to reach everyone in O(log n) rounds."""
+    return min(peer_count, max(3, math.ceil(math.log2(peer_count + 1)) + 1))
+
+
+class GossipNode:
+    """
+    Spreads items (transactions, blocks: any framing-encodable value) to every
+    node of a cluster without anyone sending to everyone.
+
+    A node that gets a new item announces its hash ("inv") to `fanout` random
+    peers. A peer asks ("getdata") only for the hashes it lacks and, once it has
+    the item, announces it in turn. Announcements are held for GOSSIP_INTERVAL
+    so that many hashes share a frame. The full item crosses each link at
+    most once; only 32-byte hashes are duplicated. The random fan-out reaches
+    the whole cluster in O(log n) hops, and a periodic anti-entropy round
+    re-announces recent items to one random peer to repair the rare node the
+    epidemic missed.
+    """
+
+    def __init__(self, host, port, peers, on_item=None, fanout=None):
+        self.address = (host, port)
+        self.peer_addresses = [tuple(peer) for peer in peers if tuple(peer) != self.address]
+        self.fanout = fanout or default_fanout(len(self.peer_addresses))
+        self.on_item = on_item  # Called with (hash, item) for every new item
+        self.lock = threading.Lock()
+        self.links = {}  # address -> Peer, created on first use
+        self.items = collections.OrderedDict()  # hash -> item
+        self.requested = {}  # hash -> time of the last getdata
+        self.recent = collections.deque()  # (time, hash) of items to re-announce
+        self.outbox = collections.defaultdict(list)  # address -> hashes to announce
+        self.stats = collections.Counter()  # Bytes, announcements and duplicates received
+        self.wakeup = threading.Event()  # Set when there is something to announce
+        self.running = True
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen(128)
+
+    def _link(self, address):
+        address = tuple(address)
+        if address not in self.links:
+            self.links[address] = Peer(address)
+        return self.links[address]
+
+    def _send(self, address, message):
+        message["from"] = list(self.address)
+        self._link(address).send(message)
+
+    def publish(self, item):
+        """Add a local item and start spreading it, returns its hash."""
+        with self.lock:
+            return self._store(item_hash(item), item, None)
+
+    def has(self, h):
+        with self.lock:
+            return h in self.items
+
+    def _store(self, h, item, source):
+        if h in self.items:
+            return h
+        self.items[h] = item
+        if len(self.items) > MAX_ITEMS:
+            self.items.popitem(last=False)
+        self.requested.pop(h, None)
+        self.recent.append((time.monotonic(), h))
+        candidates = [peer for peer in self.peer_addresses if peer != source]
+        for peer in random.sample(candidates, min(self.fanout, len(candidates))):
+            self.outbox[peer].append(h)
+        self.wakeup.set()
+        if self.on_item:
+            self.on_item(h, item)
+        return h
+
+    # Incoming messages
+
+    def _on_inv(self, message):
+        now = time.monotonic()
+        wanted = []
+        for h in message["hashes"]:
+            if h in self.items:
+                continue
+            # Ask the first announcer; ask again, this one, if the item never came
+            if now - self.requested.get(h, -REQUEST_TIMEOUT) >= REQUEST_TIMEOUT:
+                self.requested[h] = now
+                wanted.append(h)
+        if wanted:
+            self._send(message["from"], {"type": "getdata", "hashes": wanted})
+
+    def _on_getdata(self, message):
+        items = [self.items[h] for h in message["hashes"] if h in self.items]
+        if items:
+            self._send(message["from"], {"type": "data", "items": items})
+
+    def _on_data(self, message):
+        source = tuple(message["from"])
+        for item in message["items"]:
+            h = item_hash(item)
+            if h in self.items:
+                self.stats["duplicate_items"] += 1
+            else:
+                self.stats["items"] += 1
+                self._store(h, item, source)
+
+    def handle_connection(self, conn):
+        reader = FrameReader(conn)
+        handlers = {"inv": self._on_inv, "getdata": self._on_getdata, "data": self._on_data}
+        try:
+            while True:
+                frame = reader.read_frame()
+                if frame is None:
+                    break
+                message = decode(frame)
+                handler = handlers.get(message.get("type"))
+                if handler is None:
+                    continue
+                with self.lock:
+                    self.stats["bytes_in"] += len(frame)
+                    self.stats[message["type"] + "_messages"] += 1
+                    handler(message)
+        finally:
+            conn.close()
+
+    # Background work
+
+    def _flush_loop(self):
+        last_anti_entropy = time.monotonic()
+        while self.running:
+            self.wakeup.wait(ANTI_ENTROPY_INTERVAL)
+            time.sleep(GOSSIP_INTERVAL)  # Batch what arrives meanwhile into the same frames
+            with self.lock:
+                self.wakeup.clear()
+                now = time.monotonic()
+                while self.recent and now - self.recent[0][0] > RECENT_WINDOW:
+                    self.recent.popleft()
+                if self.recent and self.peer_addresses and now - last_anti_entropy >= ANTI_ENTROPY_INTERVAL:
+                    last_anti_entropy = now
+                    self.outbox[random.choice(self.peer_addresses)].extend(h for _, h in self.recent)
+                outbox, self.outbox = self.outbox, collections.defaultdict(list)
+                for address, hashes in outbox.items():
+                    self._send(address, {"type": "inv", "hashes": list(dict.fromkeys(hashes))})
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break  # Closed by stop()
+            threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+    def start(self):
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)  # Wakes the accept loop
+        except OSError:
+            pass
+        self.server.close()
+        self.wakeup.set()
+        with self.lock:
+            for link in self.links.values():
+                link.close()
@@ -0,0 +1,58 @@
+import queue
+import threading
+import time
+
+GROUP_COMMIT_WINDOW = 0.005  # Seconds a batch stays open for more records
+
+
+class GroupCommitWriter:
+    """
+    Single background thread that owns all writes to a log.
+
+    `log` is anything with an append_batch(records) method that makes the
+    records durable (Ledger, CoinLog). Records arriving within `window` seconds
+    of each other, plus whatever queued up while the previous batch was being
+    flushed, are appended as one batch with a single fsync. write() returns
+    only once the caller's batch is on disk, so many concurrent writers share
+    each disk flush.
+    """
+
+    def __init__(self, log, window=GROUP_COMMIT_WINDOW):
+        self.log = log
+        self.window = window
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, record):
+        """Queue a record without waiting; pass the result to wait()."""
+        pending = {"record": record, "done": threading.Event(), "error": None}
+        self.queue.put(pending)
+        return pending
+
+    def wait(self, pending):
+        """Block until the batch holding a submitted record is durable."""
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise pending["error"]
+
+    def write(self, record):
+        """Queue a record and block until the batch holding it is durable."""
+        self.wait(self.submit(record))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.log.append_batch([pending["record"] for pending in batch])
+            except Exception as e:  # Reported to every writer of the batch, the thread keeps serving the next ones
+                for pending in batch:
+                    pending["error"] = e
+            for pending in batch:
+                pending["done"].set()
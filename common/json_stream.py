@@ -0,0 +1,101 @@
+import json
+
+CHUNK_SIZE = 1 << 16
+DELIMITERS = (",", "]", "}", " ", "\t", "\r", "\n")
+_decoder = json.JSONDecoder()
+
+
+class JSONStream:
+    """
+    Incremental reader over a JSON document, reading the file a chunk at a time.
+
+    Only the value currently being decoded is held in memory, so the elements of
+    a large array can be consumed one by one instead of loading the whole file.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+
+    def _fill(self):
+        """Read another chunk, returns False at end of file."""
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ("" at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut at the chunk boundary ("1.5e" of "1.5e10") decodes as a
+            # shorter one, so it only counts once a delimiter follows it
+            if (self.buffer[self.pos] not in "\"[{" and self.buffer[end:end + 1] not in DELIMITERS
+                    and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Yield the elements of the array at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+    def members(self):
+        """
+        Yield the keys of the object at the current position.
+
+        The caller must consume each member's value (with value() or items())
+        before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+
+def iter_json_array(path):
+    """Yield the elements of a file holding a top-level JSON array."""
+    with open(path, "r") as f:
+        yield from JSONStream(f).items()
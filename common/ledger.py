@@ -0,0 +1,247 @@
+import itertools
+import json
+import os
+import threading
+
+from json_stream import JSONStream
+from snapshot import SNAPSHOT_INTERVAL, file_lock, temp_path, write_snapshot
+
+
+class Ledger:
+    """
+    The {"clients", "transactions"} ledger as a snapshot plus a tail log.
+
+    The JSON file keeps its original layout and serves as the snapshot;
+    transactions recorded after it are appended, one JSON object per line, to a
+    tail log next to it (ledger.json -> ledger.jsonl). Both are streamed, so
+    reading the ledger never loads every transaction at once.
+
+    Every `snapshot_every` transactions the tail is compacted: its records are
+    moved to an append-only archive (ledger.archive.jsonl), a small snapshot of
+    the clients and archive position is written and a fresh tail is started.
+    Restarting then reads the snapshot and at most one interval of tail.
+
+    Both rewrites of the snapshot (compaction and register_clients) hold a
+    lock file (ledger.json.lock), since register_clients.py runs in its own
+    process while a server may be compacting.
+    """
+
+    def __init__(self, path, snapshot_every=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.base = os.path.splitext(path)[0]
+        self.archive_path = self.base + ".archive.jsonl"
+        self.lock_path = path + ".lock"
+        self.snapshot_every = snapshot_every
+        self.lock = threading.Lock()
+
+        meta = {key: value for key, value in self._snapshot() if key not in ("clients", "transactions")}
+        self.generation = meta.get("generation", 0)
+        self.log_path = self._tail_path(self.generation)
+        self.archived = meta.get("archived", 0)  # Transactions in the archive
+        self.archive_size = meta.get("archive_size", 0)  # Bytes of the archive the snapshot covers
+        self.tail_count = sum(1 for _ in self._tail())
+
+    def _tail_path(self, generation):
+        return f"{self.base}.jsonl" if generation == 0 else f"{self.base}.{generation}.jsonl"
+
+    def _snapshot(self):
+        """Yield the snapshot's members in file order, one ("transactions", tx) per transaction."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            stream = JSONStream(f)
+            for key in stream.members():
+                if key == "transactions":
+                    for transaction in stream.items():
+                        yield key, transaction
+                else:
+                    yield key, stream.value()
+
+    def _archive(self, size=None):
+        """Archived transactions, up to `size` bytes (by default what the snapshot covers)."""
+        if size is None:
+            size = self.archive_size
+        if not os.path.exists(self.archive_path):
+            return
+        with open(self.archive_path, "rb") as f:
+            offset = 0
+            for line in f:
+                offset += len(line)
+                if offset > size:
+                    return  # Written by a compaction that crashed before its snapshot
+                yield json.loads(line)
+
+    def _tail(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "r") as f:
+            for line in f:
+                try:
+                    transaction = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A record torn by a crash mid-append
+                yield transaction
+
+    def clients(self):
+        """Registered clients; stops reading as soon as the snapshot's "clients" member is parsed."""
+        for key, value in self._snapshot():
+            if key == "clients":
+                return value
+        return {}
+
+    def transactions(self):
+        """Generator over every transaction: archived, in the snapshot, then in the tail log."""
+        yield from self._archive()
+        yield from self._snapshot_and_tail()
+
+    def pinned_transactions(self, start=0):
+        """
+        Generator over the transactions from index `start` on, as they are now,
+        that stays valid once the lock is released. Call it with self.lock held.
+
+        The archive only grows, so the archived part is streamed later up to its
+        current size; the rest (at most one compaction interval once the ledger
+        has been compacted) is copied now, before a compaction can move it.
+        """
+        archived, archive_size = self.archived, self.archive_size
+        rest = self._snapshot_and_tail()
+        rest = list(itertools.islice(rest, max(0, start - archived), None))
+
+        def generate():
+            if start < archived:
+                yield from itertools.islice(self._archive(archive_size), start, None)
+            yield from rest
+        return generate()
+
+    def _snapshot_and_tail(self):
+        for key, value in self._snapshot():
+            if key == "transactions":
+                yield value
+        yield from self._tail()
+
+    def append(self, transaction):
+        """Record a transaction by appending it to the tail log."""
+        self.append_batch([transaction])
+
+    def append_batch(self, transactions):
+        """Append several transactions with one write and one fsync."""
+        records = "".join(json.dumps(transaction) + "\n" for transaction in transactions)
+        with self.lock:
+            with open(self.log_path, "a") as f:
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            self.tail_count += len(transactions)
+            if self.tail_count >= self.snapshot_every:
+                self._compact()
+
+    def snapshot(self):
+        """Write a snapshot now instead of waiting for the interval."""
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        with file_lock(self.lock_path):
+            self._write_compaction()
+
+    def _write_compaction(self):
+        clients = self.clients()
+        count = 0
+        with open(self.archive_path, "ab") as archive:
+            archive.truncate(self.archive_size)  # Drop what a crashed compaction left behind
+            for key, value in self._snapshot():
+                if key == "transactions":
+                    archive.write(json.dumps(value).encode() + b"\n")
+                    count += 1
+            for transaction in self._tail():
+                archive.write(json.dumps(transaction).encode() + b"\n")
+                count += 1
+            archive.flush()
+            os.fsync(archive.fileno())
+            archive_size = archive.seek(0, os.SEEK_END)
+
+        old_tail = self.log_path
+        write_snapshot(self.path, {
+            "clients": clients,
+            "transactions": [],
+            "archived": self.archived + count,
+            "archive_size": archive_size,
+            "generation": self.generation + 1,
+        })
+        # The new snapshot points at a fresh tail, the old one is only deleted after it is durable
+        self.generation += 1
+        self.log_path = self._tail_path(self.generation)
+        self.archived += count
+        self.archive_size = archive_size
+        self.tail_count = 0
+        if os.path.exists(old_tail):
+            os.remove(old_tail)
+        print(f"[LEDGER] Snapshot written, {self.archived} transactions archived")
+
+    def register_clients(self, clients):
+        """
+        Add {client hash: name} entries with a single rewrite of the snapshot,
+        however many there are. Returns the number of new clients.
+        """
+        with self.lock, file_lock(self.lock_path):
+            registered = self.clients()
+            added = {client_hash: name for client_hash, name in clients.items() if client_hash not in registered}
+            if not added:
+                return 0
+            registered.update(added)
+
+            # Stream the snapshot's transactions through, clients first so clients() stays fast
+            meta = {}
+            tmp_path = temp_path(self.path)
+            with open(tmp_path, "w") as f:
+                f.write('{\n    "clients": ' + json.dumps(registered, indent=4).replace("\n", "\n    "))
+                f.write(',\n    "transactions": [')
+                separator = "\n        "
+                for key, value in self._snapshot():
+                    if key == "transactions":
+                        f.write(separator + json.dumps(value))
+                        separator = ",\n        "
+                    elif key != "clients":
+                        meta[key] = value
+                f.write("\n    ]")
+                for key, value in meta.items():
+                    f.write(f",\n    {json.dumps(key)}: {json.dumps(value)}")
+                f.write("\n}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(added)
+
+    def load(self):
+        """The ledger in its original shape, with transactions as a generator."""
+        return {"clients": self.clients(), "transactions": self.transactions()}
+
+
+class ClientRegistry:
+    """
+    Registered client hashes kept in memory for O(1) membership checks.
+
+    The ledger snapshot is only re-parsed when its modification time changes,
+    i.e. after register_clients.py (or a compaction) rewrote it.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.clients = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.ledger.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.mtime:
+            with self.lock:
+                # Stat before loading: a rewrite during the load triggers another reload
+                self.clients = self.ledger.clients() if mtime is not None else {}
+                self.mtime = mtime
+
+    def __contains__(self, client_hash):
+        self._refresh()
+        return client_hash in self.clients
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import queue
+import time
+
+from pow_engine import ascii_nonce, search_nonce
+
+# Nonces handed to a worker at a time; worker i searches chunks i, i + workers, ...
+CHUNK_SIZE = 1 << 16
+RESULT_POLL = 0.5  # Seconds between checks that the workers are still alive
+
+
+class SharedFlag:
+    """A stop flag in shared memory that every worker process can poll without locking."""
+
+    def __init__(self):
+        self._value = multiprocessing.RawValue("b", 0)
+
+    def set(self):
+        self._value.value = 1
+
+    def is_set(self):
+        return self._value.value == 1
+
+
+def _worker(index, workers, prefix, target, chunk_size, encode, stop_flag, results):
+    """Search this worker's share of the nonce space until a solution is found or stopped."""
+    chunk = index
+    while not stop_flag.is_set():
+        start = chunk * chunk_size
+        found = search_nonce(prefix, target, start, start + chunk_size, cancel=stop_flag, encode=encode)
+        if found is not None:
+            stop_flag.set()  # Tell every other worker to stop
+            results.put((index, found[0], found[1], time.time()))
+            return
+        chunk += workers
+
+
+def mine_parallel(prefix, target, workers=None, chunk_size=CHUNK_SIZE, encode=ascii_nonce):
+    """
+    Search for a nonce on several processes, each on disjoint nonce ranges.
+
+    :param prefix: The fixed part of the preimage, the nonce is appended to it.
+    :param target: Integer target the hash must be below.
+    :param workers: Number of worker processes (defaults to the CPU count).
+    :param encode: Module-level nonce serializer from pow_engine (must be picklable).
+    :return: (worker_index, nonce, hash_value, time_taken)
+    :raises RuntimeError: if a worker process dies before a solution is found.
+    """
+    workers = workers or os.cpu_count() or 1
+    stop_flag = SharedFlag()
+    results = multiprocessing.Queue()
+    start_time = time.time()
+
+    processes = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(index, workers, prefix, target, chunk_size, encode, stop_flag, results),
+            daemon=True
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # The first result wins; the flag is already set, so the others stop within one check
+    while True:
+        try:
+            index, nonce, block_hash, end_time = results.get(timeout=RESULT_POLL)
+            break
+        except queue.Empty:
+            crashed = [(i, process.exitcode) for i, process in enumerate(processes)
+                       if not process.is_alive() and process.exitcode != 0]
+            if crashed:
+                stop_flag.set()
+                for process in processes:
+                    process.join()
+                raise RuntimeError(f"Mining worker {crashed[0][0]} exited with code {crashed[0][1]}")
+    stop_flag.set()
+    for process in processes:
+        process.join()
+
+    return index, nonce, block_hash, end_time - start_time
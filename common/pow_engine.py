@@ -0,0 +1,68 @@
+import hashlib
+
+# How many nonces are tried between checks of the stop range / cancel token
+CHECK_INTERVAL = 4096
+
+
+def target_for_zeros(zeros):
+    """Integer target equivalent to requiring `zeros` leading hex zeros."""
+    return 1 << (256 - 4 * zeros)
+
+
+def target_bytes(target):
+    """Render an integer target as 32 big-endian bytes for raw digest comparison."""
+    # A digest is below the target iff its big-endian bytes sort below these bytes
+    if target >= 1 << 256:
+        return None  # Every digest qualifies
+    return target.to_bytes(32, "big")
+
+
+def ascii_nonce(nonce):
+    """The nonce as decimal text, as in f"{data}{nonce}"."""
+    return b"%d" % nonce
+
+
+def binary_nonce(nonce):
+    """The nonce as the 8-byte big-endian field of a binary block header."""
+    return nonce.to_bytes(8, "big")
+
+
+def search_nonce(prefix, target, start=0, stop=None, cancel=None, encode=ascii_nonce):
+    """
+    Find the first nonce in [start, stop) such that
+    sha256(prefix + encode(nonce)) is below `target`.
+
+    The fixed prefix is hashed once; every attempt clones that midstate and
+    only feeds the nonce bytes.
+
+    :param prefix: The fixed part of the preimage (str or bytes).
+    :param target: Integer target the digest must be below.
+    :param cancel: Optional object with is_set(), checked every CHECK_INTERVAL nonces.
+    :param encode: How the nonce is serialized after the prefix (ascii_nonce or binary_nonce).
+    :return: (nonce, hash_hex) or None if the range is exhausted or cancelled.
+    """
+    if isinstance(prefix, str):
+        prefix = prefix.encode()
+    midstate = hashlib.sha256(prefix)
+    clone = midstate.copy
+    limit = target_bytes(target)
+
+    if limit is None:
+        h = clone()
+        h.update(encode(start))
+        return start, h.hexdigest()
+
+    nonce = start
+    while stop is None or nonce < stop:
+        if cancel is not None and cancel.is_set():
+            return None
+        end = nonce + CHECK_INTERVAL
+        if stop is not None and end > stop:
+            end = stop
+        for n in range(nonce, end):
+            h = clone()
+            h.update(encode(n))
+            if h.digest() < limit:
+                return n, h.hexdigest()
+        nonce = end
+    return None
@@ -0,0 +1,243 @@
+import collections
+import itertools
+import queue
+import socket
+import threading
+import time
+
+from framing import FrameReader, send_message
+from group_commit import GroupCommitWriter
+
+REPLICATION_BATCH = 512  # Entries per frame
+REPLICATION_BUFFER = 65536  # Recent entries kept in memory for a replica that is behind
+MAX_IN_FLIGHT = 8192  # Entries sent but not acknowledged before the sender waits
+RECONNECT_DELAY = 1.0  # Seconds between attempts to reach the replica
+
+
+class ReplicationSender:
+    """
+    Streams a Ledger's transactions to a replica over one long-lived connection.
+
+    Sequence number n is the ledger's n-th transaction. Transactions are made
+    durable through a GroupCommitWriter, and only durable ones are sent, as
+    {"seq": first, "entries": [...]} frames of up to REPLICATION_BATCH entries.
+    Frames are pipelined: acknowledgements ({"ack": seq}) are read by a second
+    thread, and the sender only waits once MAX_IN_FLIGHT entries are
+    unacknowledged.
+
+    On every (re)connect the replica first reports the last sequence number it
+    has stored, and streaming resumes after it: from memory for the last
+    REPLICATION_BUFFER entries, otherwise from the ledger files.
+    """
+
+    def __init__(self, ledger, address):
+        self.ledger = ledger
+        self.address = address
+        self.writer = GroupCommitWriter(ledger)
+        self.lock = threading.Lock()  # Sequence numbers are handed out in the writer's queue order
+        self.queued = collections.deque()  # Submitted to the writer, not numbered yet
+        self.changed = threading.Condition()
+        self.durable = sum(1 for _ in ledger.transactions())  # Highest sequence number on disk
+        self.next_seq = self.durable + 1  # Given to the next record that reaches the disk
+        self.recent = collections.deque(maxlen=REPLICATION_BUFFER)  # (seq, transaction)
+        self.acked = 0
+        self.connected = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def record(self, transaction):
+        """Append a transaction to the ledger and queue it for the replica; returns once it is on disk."""
+        with self.lock:
+            self.queued.append(self.writer.submit(transaction))
+            pending = self.queued[-1]
+        pending["done"].wait()
+        with self.lock:
+            # Batches finish in queue order: number the flushed records at the head, skipping failed
+            # ones, so sequence number n stays the ledger's n-th transaction
+            while self.queued and self.queued[0]["done"].is_set():
+                done = self.queued.popleft()
+                if done["error"] is None:
+                    done["seq"] = self.next_seq
+                    self.recent.append((self.next_seq, done["record"]))
+                    self.next_seq += 1
+            durable = self.next_seq - 1
+        with self.changed:
+            if durable > self.durable:
+                self.durable = durable
+                self.changed.notify_all()
+        self.writer.wait(pending)  # Raises the write's error
+        return pending["seq"]
+
+    def _recent(self, first, last):
+        """Entries first..last from memory, or None if first has already left the buffer."""
+        with self.lock:
+            if not self.recent or self.recent[0][0] > first:
+                return None
+            start = first - self.recent[0][0]
+            return [transaction for _, transaction in itertools.islice(self.recent, start, start + last - first + 1)]
+
+    def _run(self):
+        while True:
+            try:
+                conn = socket.create_connection(self.address)
+            except OSError:
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                self._stream(conn)
+            except OSError as e:
+                print(f"[REPLICATION] Connection to replica lost: {e}")
+            finally:
+                conn.close()
+            time.sleep(RECONNECT_DELAY)
+
+    def _stream(self, conn):
+        send_message(conn, {"action": "replicate"})
+        reader = FrameReader(conn)
+        hello = reader.read_message()
+        if hello is None:
+            return
+        sent = self.acked = hello["last_seq"]
+        print(f"[REPLICATION] Replica at #{sent}, ledger at #{self.durable}")
+        self.connected = True
+        acks = threading.Thread(target=self._read_acks, args=(reader,))
+        acks.start()
+        try:
+            while True:
+                with self.changed:
+                    while self.connected and (sent >= self.durable or sent - self.acked >= MAX_IN_FLIGHT):
+                        self.changed.wait()
+                    if not self.connected:
+                        return
+                    last = min(self.durable, sent + REPLICATION_BATCH)
+                entries = self._recent(sent + 1, last)
+                if entries is None:
+                    sent = self._catch_up(conn, sent)
+                    continue
+                send_message(conn, {"seq": sent + 1, "entries": entries})
+                sent = last
+        finally:
+            # Wake the ack reader so it is gone before the next connection starts
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            acks.join()
+
+    def _catch_up(self, conn, sent):
+        """Send the entries that are no longer in memory from the ledger files; returns the last one sent."""
+        # Only pinning the range needs the ledger lock: a slow replica must not hold up new transactions
+        with self.ledger.lock:
+            with self.lock:
+                end = self.recent[0][0] - 1 if self.recent else self.durable
+            transactions = self.ledger.pinned_transactions(sent)
+        transactions = itertools.islice(transactions, end - sent)
+        while True:
+            entries = list(itertools.islice(transactions, REPLICATION_BATCH))
+            if not entries:
+                return sent
+            send_message(conn, {"seq": sent + 1, "entries": entries})
+            sent += len(entries)
+
+    def _read_acks(self, reader):
+        while True:
+            message = reader.read_message()
+            with self.changed:
+                if message is None:
+                    self.connected = False
+                    self.changed.notify_all()
+                    return
+                self.acked = max(self.acked, message["ack"])
+                self.changed.notify_all()
+
+
+class ReplicationReceiver:
+    """
+    Replica side of the stream: stores the entries in its own Ledger and
+    acknowledges each frame once it is on disk.
+
+    Frames are handed to a GroupCommitWriter and reading continues at once;
+    a separate thread sends the acknowledgements as the flushes complete, so
+    frames arriving during one fsync share the next. Only sequence numbers
+    known to be on disk are acknowledged or reported to a reconnecting sender.
+    """
+
+    def __init__(self, ledger, on_stored=None):
+        self.ledger = ledger
+        self.writer = GroupCommitWriter(ledger)
+        self.on_stored = on_stored  # Called with the last stored sequence number
+        self.durable_seq = sum(1 for _ in ledger.transactions())  # Last entry known to be on disk
+        self.last_seq = self.durable_seq  # Last entry handed to the writer
+        self.lock = threading.Lock()  # One stream at a time
+
+    def handle(self, conn, reader):
+        """Serve a replication stream whose {"action": "replicate"} frame was already read."""
+        with self.lock:
+            # The previous stream's acker has finished, everything it was handed is on disk or failed
+            self.last_seq = self.durable_seq
+            send_message(conn, {"last_seq": self.durable_seq})
+            acks = queue.Queue()
+            failed = threading.Event()  # Set by the acker once a flush failed
+            acker = threading.Thread(target=self._send_acks, args=(conn, acks, failed))
+            acker.start()
+            try:
+                while True:
+                    frame = reader.read_message()
+                    if frame is None or failed.is_set():
+                        break
+                    skip = self.last_seq + 1 - frame["seq"]  # Resent after a reconnect
+                    if skip < 0:
+                        print(f"[REPLICATION] Gap before #{frame['seq']}, expected #{self.last_seq + 1}")
+                        break
+                    entries = frame["entries"][skip:]
+                    if not entries:
+                        continue
+                    for transaction in entries:
+                        pending = self.writer.submit(transaction)
+                    self.last_seq += len(entries)
+                    acks.put((self.last_seq, pending))
+            finally:
+                acks.put(None)
+                acker.join()
+
+    def _send_acks(self, conn, acks, failed):
+        while True:
+            item = acks.get()
+            if item is None:
+                return
+            seq, pending = item
+            good = self.durable_seq
+            try:
+                self.writer.wait(pending)
+                good = seq
+                while not acks.empty() and acks.queue[0] is not None:
+                    seq, pending = acks.get()  # Flushed by the same batch or the next, one ack covers them
+                    self.writer.wait(pending)
+                    good = seq
+            except Exception as e:
+                print(f"[REPLICATION] Could not store entries up to #{seq}: {e}")
+                self.durable_seq = good
+                failed.set()
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)  # Ends the stream, the sender resends after durable_seq
+                except OSError:
+                    pass
+                self._drain(acks)
+                return
+            self.durable_seq = seq
+            try:
+                send_message(conn, {"ack": seq})
+            except OSError:
+                continue  # The sender reconnects and resumes from durable_seq
+            if self.on_stored:
+                self.on_stored(seq)
+
+    def _drain(self, acks):
+        """After a failed flush nothing else is acknowledged: durable_seq stays at the last entry known good."""
+        while True:
+            item = acks.get()
+            if item is None:
+                return
+            try:
+                self.writer.wait(item[1])  # Finished before the next stream starts
+            except Exception:
+                pass
@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import socket
+import threading
+
+SEND_QUEUE_LIMIT = 256  # Messages queued for one client before its slow-consumer policy applies
+
+# What happens when a client's queue is full:
+#   "drop"       - the oldest queued message is dropped, the client keeps the newest ones
+#   "disconnect" - the client is disconnected
+#   "coalesce"   - the queued messages with the same key are dropped and the message
+#                  goes to the tail, so the client skips to the latest of each key in
+#                  order; without a match, as "drop"
+POLICIES = ("drop", "disconnect", "coalesce")
+
+# What put() reports
+QUEUED = "queued"
+SLOW = "slow"  # Full under "disconnect": the caller disconnects the client
+CLOSED = "closed"  # The queue was already closed, nothing was queued
+
+
+class SendQueue:
+    """
+    Bounded outbound queue of framed messages for one client.
+
+    Broadcasts only append to the queue, so one slow client never delays the
+    others; its own writer sends everything queued with a single write.
+    """
+
+    def __init__(self, limit=SEND_QUEUE_LIMIT, policy="drop"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy {policy!r}, expected one of {POLICIES}")
+        self.limit = limit
+        self.policy = policy
+        self.frames = collections.deque()  # (key, frame)
+        self.closed = False
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def _offer(self, frame, key):
+        """Queue a frame under the policy, returns False if the client must be disconnected."""
+        if len(self.frames) >= self.limit:
+            if self.policy == "disconnect":
+                return False
+            kept = self.frames
+            if self.policy == "coalesce" and key is not None:
+                kept = collections.deque(entry for entry in self.frames if entry[0] != key)
+                self.coalesced += len(self.frames) - len(kept)
+            if len(kept) == len(self.frames):
+                kept.popleft()
+                self.dropped += 1
+            self.frames = kept
+        self.frames.append((key, frame))
+        self.max_depth = max(self.max_depth, len(self.frames))
+        return True
+
+    def _take(self):
+        frames = [frame for _, frame in self.frames]
+        self.frames.clear()
+        return frames
+
+    def metrics(self):
+        return {
+            "depth": len(self.frames),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class ThreadedSendQueue(SendQueue):
+    """SendQueue for a blocking socket, drained by its own writer thread."""
+
+    def __init__(self, sock, limit=SEND_QUEUE_LIMIT, policy="drop"):
+        super().__init__(limit, policy)
+        self.sock = sock
+        self.ready = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def put(self, frame, key=None):
+        """Queue a frame without blocking, returns QUEUED, SLOW (disconnect the client) or CLOSED."""
+        with self.ready:
+            if self.closed:
+                return CLOSED
+            if not self._offer(frame, key):
+                return SLOW
+            self.ready.notify()
+            return QUEUED
+
+    def close(self, abort=False):
+        """Stop the writer; abort also shuts the socket down, waking a blocked send and the client's reader."""
+        with self.ready:
+            self.closed = True
+            if abort:
+                self.frames.clear()
+            self.ready.notify()
+        if abort:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            with self.ready:
+                while not self.frames and not self.closed:
+                    self.ready.wait()
+                if not self.frames:
+                    return
+                frames = self._take()
+            try:
+                self.sock.sendall(b"".join(frames))
+            except OSError:
+                self.close()
+                return
+            self.sent += len(frames)
+
+
+class AsyncSendQueue(SendQueue):
+    """SendQueue for an asyncio StreamWriter, drained by its own task."""
+
+    def __init__(self, writer, limit=SEND_QUEUE_LIMIT, policy="drop"):
+        super().__init__(limit, policy)
+        self.writer = writer
+        self.ready = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def put(self, frame, key=None):
+        if self.closed:
+            return CLOSED
+        if not self._offer(frame, key):
+            return SLOW
+        self.ready.set()
+        return QUEUED
+
+    def close(self, abort=False):
+        self.closed = True
+        if abort:
+            self.frames.clear()
+            self.writer.transport.abort()
+        self.ready.set()
+
+    async def _run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                if not self.frames:
+                    if self.closed:
+                        return
+                    continue
+                frames = self._take()
+                self.writer.write(b"".join(frames))
+                # Messages queue up here while the socket buffer drains: that is what the limit bounds
+                await self.writer.drain()
+                self.sent += len(frames)
+        except (ConnectionError, OSError):
+            self.closed = True
@@ -0,0 +1,55 @@
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SNAPSHOT_INTERVAL = 256  # Blocks or transactions recorded between two snapshots
+
+
+def temp_path(path):
+    """A temporary file next to `path` that no other writer, thread or process, uses."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on the file at `path`, across processes, for the with block."""
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_snapshot(path, data):
+    """Atomically replace `path` with `data` as JSON; a crash leaves the previous snapshot intact."""
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    """The snapshot at `path`, or None if there is none (or it is unreadable)."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
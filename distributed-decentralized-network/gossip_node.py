@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from gossip import GossipNode
+
+HOST = "127.0.0.1"
+
+def print_item(item_hash, item):
+    print(f"[GOSSIP] {item_hash[:16]}... {item}")
+
+if __name__ == "__main__":
+    # python gossip_node.py <port> <peer port> [<peer port> ...]
+    # Every line typed is gossiped to the cluster as a transaction
+    port = int(sys.argv[1])
+    peers = [(HOST, int(peer)) for peer in sys.argv[2:]]
+    node = GossipNode(HOST, port, peers, on_item=print_item).start()
+    print(f"[GOSSIP] Node on {HOST}:{port}, {len(peers)} peers, fan-out {node.fanout}")
+    for line in sys.stdin:
+        if line.strip():
+            node.publish({"type": "transaction", "port": port, "message": line.strip()})
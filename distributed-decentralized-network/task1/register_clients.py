@@ -1,40 +1,42 @@
-import json
+import os
+import sys
 import hashlib
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from ledger import Ledger
+
 LEDGER_FILE = "ledger.json"
 
 def hash_client(client_name):
     """Generate SHA-256 hash for a given client name."""
     return hashlib.sha256(client_name.encode()).hexdigest()
 
-def load_ledger():
-    """Load ledger from JSON file, or create a new one if missing."""
-    try:
-        with open(LEDGER_FILE, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {"clients": {}, "transactions": []}
-
-def save_ledger(ledger):
-    """Save updated ledger back to JSON file."""
-    with open(LEDGER_FILE, "w") as file:
-        json.dump(ledger, file, indent=4)
-
 def register_clients(client_names):
-    """Register new clients by hashing their names and storing them in the ledger."""
-    ledger = load_ledger()
+    """Register new clients by hashing their names and storing them in the ledger.
+
+    Any number of clients is added with a single rewrite of the ledger snapshot.
+    """
+    ledger = Ledger(LEDGER_FILE)
+    registered = ledger.clients()
+    new_clients = {}
 
     for client in client_names:
         client_hash = hash_client(client)
-        if client_hash not in ledger["clients"]:
-            ledger["clients"][client_hash] = client
+        if client_hash not in registered and client_hash not in new_clients:
+            new_clients[client_hash] = client
             print(f"[REGISTER] Added {client} with hash: {client_hash}")
         else:
             print(f"[INFO] {client} is already registered.")
 
-    save_ledger(ledger)
+    ledger.register_clients(new_clients)
     print("[SUCCESS] Ledger updated with new clients.")
 
+def read_client_names(path):
+    """Client names for bulk registration, one per line."""
+    with open(path, "r") as file:
+        return [line.strip() for line in file if line.strip()]
+
 if __name__ == "__main__":
-    clients = ["Client1", "Client2"]
+    # python register_clients.py [names.txt] - bulk onboarding from a file of names
+    clients = read_client_names(sys.argv[1]) if len(sys.argv) > 1 else ["Client1", "Client2"]
     register_clients(clients)
@@ -1,58 +1,54 @@
+import os
+import sys
 import socket
-import json
 import hashlib
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+from ledger import ClientRegistry, Ledger
+from replication import ReplicationSender
+
 HOST = "127.0.0.1"
 PORT = 5001
-LEDGER_FILE = "ledger.json"
+LEDGER_FILE = "ledger.json"  # Snapshot; transactions recorded since go to ledger.jsonl
+ledger = Ledger(LEDGER_FILE)
+# Writes the ledger through group commit and streams it to Server 2 over one connection
+replication = ReplicationSender(ledger, ("127.0.0.1", 5002))
+registry = ClientRegistry(ledger)  # Reloaded only when register_clients.py changes ledger.json
 
-# Load or create the ledger
+# Load or create the ledger, streamed: "transactions" is a generator
 def load_ledger():
-    try:
-        with open(LEDGER_FILE, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {"clients": {}, "transactions": []}
-
-def save_ledger(ledger):
-    with open(LEDGER_FILE, "w") as file:
-        json.dump(ledger, file, indent=4)
+    return ledger.load()
 
 def hash_client(client_name):
     return hashlib.sha256(client_name.encode()).hexdigest()
 
 def validate_client(client_hash):
-    ledger = load_ledger()
-    return client_hash in ledger["clients"]
+    return client_hash in registry
 
 def log_transaction(client_hash, message):
-    ledger = load_ledger()
-    ledger["transactions"].append({"client": client_hash, "message": message})
-    save_ledger(ledger)
-
-def sync_with_server2(transaction):
-    try:
-        conn = socket.create_connection(("127.0.0.1", 5002))
-        conn.send(json.dumps(transaction).encode())
-        conn.close()
-    except ConnectionRefusedError:
-        print("[ERROR] Could not sync with Server 2")
+    # Batched with concurrent requests into one durable append, returns once it is on disk;
+    # Server 2 receives it over the replication stream, even if it is down right now
+    return replication.record({"client": client_hash, "message": message})
 
 def handle_client(conn):
-    data = conn.recv(1024).decode()
-    client_name, message = data.split(": ")
-    client_hash = hash_client(client_name)
+    # A client may send several framed requests on one connection
+    reader = FrameReader(conn)
+    while True:
+        data = reader.read_message()
+        if data is None:
+            break
+        client_name, message = data.split(": ")
+        client_hash = hash_client(client_name)
 
-    if validate_client(client_hash):
-        transaction = {"client": client_hash, "message": message}
-        log_transaction(client_hash, message)  # Record in ledger
-        sync_with_server2(transaction)  # Send update to Server 2
-        response = "[SERVER 1] Transaction verified and recorded."
-    else:
-        response = "[SERVER 1] Unauthorized client!"
+        if validate_client(client_hash):
+            log_transaction(client_hash, message)  # Record in ledger and replicate to Server 2
+            response = "[SERVER 1] Transaction verified and recorded."
+        else:
+            response = "[SERVER 1] Unauthorized client!"
 
-    conn.send(response.encode())
+        send_message(conn, response)
     conn.close()
 
 def start_server():
@@ -1,14 +1,33 @@
+import os
+import sys
 import socket
-import json
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+from ledger import Ledger
+from replication import ReplicationReceiver
+
 HOST = "127.0.0.1"
 PORT = 5002
+REPLICA_FILE = "replica.json"  # Server 2's copy of Server 1's ledger (tail in replica.jsonl)
+
+def report_stored(seq):
+    print(f"[SERVER 2] Ledger replicated up to transaction #{seq}")
+
+replica = ReplicationReceiver(Ledger(REPLICA_FILE), on_stored=report_stored)
 
 def handle_sync(conn):
-    data = conn.recv(4096).decode()
-    transaction = json.loads(data)
-    print(f"[SERVER 2] Received Ledger Update: {transaction}")  # No local storage
+    reader = FrameReader(conn)
+    while True:
+        message = reader.read_message()
+        if message is None:
+            break
+        if isinstance(message, dict) and message.get("action") == "replicate":
+            replica.handle(conn, reader)  # Server 1's replication stream, until it disconnects
+            break
+        print(f"[SERVER 2] Received: {message}")
+        send_message(conn, "[SERVER 2] Update received.")  # Lets the sender pipeline its next frame
     conn.close()
 
 def start_server():
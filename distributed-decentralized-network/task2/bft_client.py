@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from bft import BFTClient
+from bft_node import NODES
+
+CLIENT_NAME = "Client1"
+
+if __name__ == "__main__":
+    # python bft_client.py [name] [count] - sends count messages, batched by the leader
+    name = sys.argv[1] if len(sys.argv) > 1 else CLIENT_NAME
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    client = BFTClient(name, NODES)
+    messages = [f"Hello from {name} ({i + 1})" for i in range(count)]
+    for message, result in zip(messages, client.submit_many(messages)):
+        print(f"[{name}] {message} -> {result}")
@@ -0,0 +1,53 @@
+import os
+import sys
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from bft import BFTClient, BFTNode, generate_keys, load_keys
+from ledger import Ledger
+
+# N = 3f + 1 servers tolerate f faulty ones; here f = 1
+NODES = [("127.0.0.1", 5101), ("127.0.0.1", 5102), ("127.0.0.1", 5103), ("127.0.0.1", 5104)]
+KEYS_DIR = "bft_keys"  # node<i>.key is node i's own signing key, never given to the others
+ADMIN = "Admin"  # The only client whose "register <name>" requests are executed
+REGISTER = "register "
+registered = set()  # Client hashes, changed only by executed registrations so every node agrees
+
+def hash_client(client_name):
+    return hashlib.sha256(client_name.encode()).hexdigest()
+
+def execute(request, seq):
+    # Must give the same answer on every honest node: clients count matching replies.
+    # Registrations are ordered like any other request, so they take effect at the same batch everywhere.
+    if request["client"] == ADMIN and request["message"].startswith(REGISTER):
+        registered.add(hash_client(request["message"][len(REGISTER):]))
+        return f"Client registered in batch #{seq}."
+    if hash_client(request["client"]) in registered:
+        return f"Transaction committed in batch #{seq}."
+    return "Unauthorized client!"
+
+def replay_registrations(ledger):
+    """Rebuild the registry from the registrations this node already executed."""
+    for record in ledger.transactions():
+        for request in record["requests"]:
+            if request["client"] == ADMIN:
+                execute(request, record["seq"])
+
+if __name__ == "__main__":
+    # python bft_node.py keygen             - create every node's key pair once
+    # python bft_node.py register <name>... - register clients through the nodes' agreement
+    # python bft_node.py <node> [--faulty]  - a faulty node rejects everything, like Server 1
+    if sys.argv[1] == "keygen":
+        generate_keys(KEYS_DIR, len(NODES))
+        print(f"Keys for {len(NODES)} nodes written to {KEYS_DIR}/")
+        sys.exit(0)
+    if sys.argv[1] == "register":
+        names = sys.argv[2:] or ["Client1", "Client2"]
+        for name, result in zip(names, BFTClient(ADMIN, NODES).submit_many([REGISTER + name for name in names])):
+            print(f"[REGISTER] {name} -> {result}")
+        sys.exit(0)
+    node = int(sys.argv[1])
+    private_key, public_keys = load_keys(KEYS_DIR, node)
+    ledger = Ledger(f"ledger_node{node}.json")  # This node's copy: one record per committed batch
+    replay_registrations(ledger)
+    BFTNode(node, NODES, ledger, execute, private_key, public_keys, faulty="--faulty" in sys.argv).start()
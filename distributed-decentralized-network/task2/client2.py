@@ -1,6 +1,11 @@
+import os
+import sys
 import socket
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+import framing
+
 SERVERS = [("127.0.0.1", 5001), ("127.0.0.1", 5002)]
 CLIENT_NAME = "Client2"
 MESSAGE = "Hello from Client2"
@@ -9,8 +14,8 @@ def send_message(server_host, server_port):
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
         client.connect((server_host, server_port))
-        client.send(f"{CLIENT_NAME}: {MESSAGE}".encode())
-        response = client.recv(1024).decode()
+        framing.send_message(client, f"{CLIENT_NAME}: {MESSAGE}")
+        response = framing.FrameReader(client).read_message()
         print(f"[CLIENT 2] Response from {server_host}:{server_port} -> {response}")
     except ConnectionRefusedError:
         print(f"[CLIENT 2] Could not connect to {server_host}:{server_port}")
@@ -1,54 +1,55 @@
+import os
+import sys
 import socket
-import json
 import hashlib
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+from ledger import Ledger
+
 HOST = "127.0.0.1"
 PORT = 5001
-LEDGER_FILE = "ledger.json"
+LEDGER_FILE = "ledger.json"  # Snapshot; transactions recorded since go to ledger.jsonl
+ledger = Ledger(LEDGER_FILE)
 
-# Load or create the ledger
+# Load or create the ledger, streamed: "transactions" is a generator
 def load_ledger():
-    try:
-        with open(LEDGER_FILE, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {"clients": {}, "transactions": []}
-
-def save_ledger(ledger):
-    with open(LEDGER_FILE, "w") as file:
-        json.dump(ledger, file, indent=4)
+    return ledger.load()
 
 def hash_client(client_name):
     return hashlib.sha256(client_name.encode()).hexdigest()
 
 def validate_client(client_hash):
-    ledger = load_ledger()
-    return client_hash in ledger["clients"]
+    return client_hash in load_ledger()["clients"]
 
 def log_transaction(client_hash, message):
-    ledger = load_ledger()
-    ledger["transactions"].append({"client": client_hash, "message": message})
-    save_ledger(ledger)
+    # Only the new transaction is written, not the whole ledger
+    ledger.append({"client": client_hash, "message": message})
 
 def sync_with_server2(transaction):
     try:
         conn = socket.create_connection(("127.0.0.1", 5002))
-        conn.send(json.dumps(transaction).encode())
+        send_message(conn, transaction)
         conn.close()
     except ConnectionRefusedError:
         print("[ERROR] Could not sync with Server 2")
 
 def handle_client(conn):
-    data = conn.recv(1024).decode()
-    client_name, message = data.split(": ")
-    client_hash = hash_client(client_name)
+    # A client may send several framed requests on one connection
+    reader = FrameReader(conn)
+    while True:
+        data = reader.read_message()
+        if data is None:
+            break
+        client_name, message = data.split(": ")
+        client_hash = hash_client(client_name)
 
-    # Reject all legitimate messages and don't add them to the ledger
-    response = "[SERVER 1] Message rejected and not recorded."
+        # Reject all legitimate messages and don't add them to the ledger
+        response = "[SERVER 1] Message rejected and not recorded."
 
-    # No need to validate client, log transaction, or sync with Server 2
-    conn.send(response.encode())
+        # No need to validate client, log transaction, or sync with Server 2
+        send_message(conn, response)
     conn.close()
 
 def start_server():
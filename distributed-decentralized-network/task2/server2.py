@@ -1,14 +1,22 @@
+import os
+import sys
 import socket
-import json
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+
 HOST = "127.0.0.1"
 PORT = 5002
 
 def handle_sync(conn):
-    data = conn.recv(4096).decode()
-    transaction = json.loads(data)
-    print(f"[SERVER 2] Received Ledger Update: {transaction}")  # No local storage
+    reader = FrameReader(conn)
+    while True:
+        transaction = reader.read_message()
+        if transaction is None:
+            break
+        print(f"[SERVER 2] Received Ledger Update: {transaction}")  # No local storage
+        send_message(conn, "[SERVER 2] Update received.")  # Lets the sender pipeline its next frame
     conn.close()
 
 def start_server():
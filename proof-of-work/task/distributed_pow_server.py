@@ -3,43 +3,125 @@
 import socket
 import threading
 import time
-import json
 import datetime
-from pow import proof_of_work  # see [lab3/task/pow.py](lab3/task/pow.py)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from pow_engine import search_nonce, target_for_zeros
+from blockstore import BlockStore
+from framing import FrameReader, send_message
+from nonce_coordinator import COORDINATOR_PORT, CoordinatorClient, NonceCoordinator
+
+STOP_PREFIX = "STOP "  # Control message a winning node sends to its peers
+JOB_PREFIX = "JOB "  # "JOB <id> <transaction>": a node shares the job the coordinator opened for a transaction
+DIFFICULTY = 2  # Two leading zeros per difficulty level
 
 # Global variables for winner notification and ledger updates
-winner_event = threading.Event()
-ledger_lock = threading.Lock()
-ledger_file = "ledger.json"
+node_jobs = {}  # (node name, job id) -> Event set once that job has a winner, while the node works on it
+jobs_lock = threading.Lock()
+ledger_file = "ledger.json"  # Whole-ledger JSON, migrated once into the block store
+ledger_store = BlockStore("ledger.jsonl", legacy_json=ledger_file)
 
-def append_to_ledger(entry):
-    with ledger_lock:
+def open_job(tx_data):
+    """Job id the coordinator assigns to a received transaction."""
+    coordinator = CoordinatorClient(port=COORDINATOR_PORT)
+    try:
+        return coordinator.open(tx_data)
+    finally:
+        coordinator.close()
+
+def new_job(node_name, job_id):
+    """Start this node's work on a job, returns its cancellation event or None if the node already works on it."""
+    with jobs_lock:
+        if (node_name, job_id) in node_jobs:
+            return None
+        cancel = threading.Event()
+        node_jobs[(node_name, job_id)] = cancel
+        return cancel
+
+def finish_job(node_name, job_id):
+    with jobs_lock:
+        node_jobs.pop((node_name, job_id), None)
+
+def stop_job(node_name, job_id):
+    """Cancel this node's work on a job, if it has any and the coordinator has really closed the job."""
+    with jobs_lock:
+        cancel = node_jobs.get((node_name, job_id))
+    if cancel is None or cancel.is_set():
+        return
+    coordinator = CoordinatorClient(port=COORDINATOR_PORT)
+    try:
+        if coordinator.is_solved(job_id):
+            cancel.set()
+        else:
+            print(f"{node_name} ignored a stop for job {job_id}, which is still open")
+    finally:
+        coordinator.close()
+
+def send_to_peers(node_name, message):
+    for peer_name, port in nodes:
+        if peer_name == node_name:
+            continue
         try:
-            with open(ledger_file, "r") as f:
-                ledger = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            ledger = []
-        ledger.append(entry)
-        with open(ledger_file, "w") as f:
-            json.dump(ledger, f, indent=4)
+            with socket.create_connection(("localhost", port)) as conn:
+                send_message(conn, message)
+                FrameReader(conn).read_message()
+        except ConnectionRefusedError:
+            print(f"{node_name} could not reach {peer_name}")
+
+def notify_peers(node_name, job_id):
+    """Tell every other node to stop working on a solved job."""
+    send_to_peers(node_name, f"{STOP_PREFIX}{job_id}")
+
+def share_job(node_name, job_id, tx_data):
+    """Have every other node join the job opened for a transaction this node received."""
+    send_to_peers(node_name, f"{JOB_PREFIX}{job_id} {tx_data}")
+
+def append_to_ledger(entry):
+    ledger_store.append(entry)  # Appends one record, the store serializes concurrent writers
     print("Ledger updated with:", entry)
 
-def handle_pow(node_name, tx_data, difficulty=2):
+def handle_pow(node_name, tx_data, difficulty=DIFFICULTY, job_id=None, cancel=None):
     # Use microsecond precision for times
     start_dt = datetime.datetime.now()
     start_time_formatted = start_dt.strftime('%Y-%m-%d %H:%M:%S.%f')
     print(f"{node_name} started POW at {start_time_formatted}")
     
-    # Each node starts working on the proof of work.
-    nonce, final_hash, time_taken = proof_of_work(tx_data, difficulty)
+    # Each node works through the nonce ranges the coordinator leases to it,
+    # so no two nodes ever hash the same nonce.
+    if job_id is None:
+        job_id = open_job(tx_data)
+    if cancel is None:
+        cancel = new_job(node_name, job_id)
+        if cancel is None:
+            return  # Already being worked on by this node
+    target = target_for_zeros(difficulty * 2)  # Two zeros per difficulty level
+    coordinator = CoordinatorClient(port=COORDINATOR_PORT)
+    found = None
+    while found is None and not cancel.is_set():
+        nonce_range = coordinator.lease(job_id, node_name)
+        if nonce_range is None:
+            break  # Solved by another node
+        found = search_nonce(tx_data, target, nonce_range[0], nonce_range[1], cancel=cancel)
     
     end_dt = datetime.datetime.now()
     end_time_formatted = end_dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    finish_job(node_name, job_id)
+    if found is None:
+        coordinator.close()
+        print(f"{node_name} stopped POW at {end_time_formatted}, another node already won.")
+        return
+    nonce, final_hash = found
+    time_taken = (end_dt - start_dt).total_seconds()
     print(f"{node_name} completed POW at {end_time_formatted}")
     
     # Check if another node has already won
-    if not winner_event.is_set():
-        winner_event.set()  # Mark that this node is the winner
+    won = coordinator.submit(job_id, node_name, nonce, final_hash)
+    coordinator.close()
+    if won:
+        cancel.set()
+        notify_peers(node_name, job_id)
         result = {
             "node": node_name,
             "transaction_data": tx_data,
@@ -63,16 +145,41 @@ def node_server(port, node_name):
     while True:
         conn, addr = server.accept()
         print(f"{node_name} got connection from {addr}")
-        tx_data = conn.recv(1024).decode().strip()
-        if tx_data:
-            print(f"{node_name} received transaction: {tx_data}")
-            # Reset the winner event if a new transaction arrives
-            if winner_event.is_set():
-                winner_event.clear()
-            # Start POW on this node (each node works concurrently)
-            threading.Thread(target=handle_pow, args=(node_name, tx_data, 2)).start()
-        conn.sendall("Transaction received. Processing POW...".encode())
-        conn.close()
+        threading.Thread(target=handle_connection, args=(conn, node_name), daemon=True).start()
+
+def handle_connection(conn, node_name):
+    # Each framed message is one request, a sender may pipeline several
+    reader = FrameReader(conn)
+    with conn:
+        while True:
+            tx_data = reader.read_message()
+            if tx_data is None:
+                break
+            tx_data = tx_data.strip()
+            if tx_data.startswith(STOP_PREFIX):
+                # A peer solved this job, stop working on it
+                stop_job(node_name, tx_data[len(STOP_PREFIX):])
+                send_message(conn, "Stopped.")
+                continue
+            shared = tx_data.startswith(JOB_PREFIX)
+            if shared:
+                # A peer received the transaction and shares its job
+                job_id, _, tx_data = tx_data[len(JOB_PREFIX):].partition(" ")
+            elif tx_data:
+                print(f"{node_name} received transaction: {tx_data}")
+                job_id = open_job(tx_data)
+            if tx_data:
+                cancel = new_job(node_name, job_id)
+                if cancel is not None:
+                    # Start POW on this node (each node works concurrently)
+                    threading.Thread(target=handle_pow, args=(node_name, tx_data, DIFFICULTY, job_id, cancel)).start()
+                    if not shared:
+                        threading.Thread(target=share_job, args=(node_name, job_id, tx_data), daemon=True).start()
+            send_message(conn, "Transaction received. Processing POW...")
+
+# Start the coordinator that splits the nonce space between the nodes
+coordinator = NonceCoordinator(zeros=DIFFICULTY * 2)
+threading.Thread(target=coordinator.serve, args=(COORDINATOR_PORT,), daemon=True).start()
 
 # Start decentralized nodes (threads)
 nodes = [("Node1", 5000), ("Node2", 5001), ("Node3", 5002)]
@@ -0,0 +1,144 @@
+import collections
+import hashlib
+import itertools
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from framing import FrameReader, send_message
+from pow_engine import ascii_nonce, target_for_zeros
+
+COORDINATOR_PORT = 5100
+RANGE_SIZE = 4096  # Nonces handed out per lease
+MAX_SOLVED_JOBS = 1024  # Solved jobs remembered, so a node that starts late learns the job is done
+
+
+class NonceCoordinator:
+    """
+    Assigns job ids, hands every node disjoint nonce ranges for a job and records the first valid solution.
+
+    Protocol: one framed message per request or response over TCP.
+      {"op": "open", "data": tx}  -> {"job": id}, the open job for tx if there is one, else a new job
+      {"op": "lease", "job": id, "node": name}  -> {"start": a, "end": b} or {"solved": true}
+      {"op": "submit", "job": id, "node": name, "nonce": n, "hash": h}  -> {"winner": true/false}
+      {"op": "status", "job": id}  -> {"solved": true/false}
+    """
+
+    def __init__(self, range_size=RANGE_SIZE, zeros=4):
+        self.range_size = range_size
+        self.target = target_for_zeros(zeros)
+        self.ids = itertools.count(1)
+        self.jobs = {}  # job id -> [transaction, first unleased nonce], for open jobs
+        self.open_jobs = {}  # transaction -> id of its open job
+        self.solved = collections.OrderedDict()  # job id -> winning node name
+        self.lock = threading.Lock()
+
+    def open(self, tx_data):
+        """Job id for a transaction: nodes that receive it while its job is open all join that job."""
+        with self.lock:
+            job_id = self.open_jobs.get(tx_data)
+            if job_id is None:
+                job_id = str(next(self.ids))
+                self.open_jobs[tx_data] = job_id
+                self.jobs[job_id] = [tx_data, 0]
+        return job_id
+
+    def lease(self, job_id, node_name):
+        """Return the next (start, stop) range for this job, or None if it is no longer open."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            start = job[1]
+            job[1] += self.range_size
+        return start, start + self.range_size
+
+    def submit(self, job_id, node_name, nonce, hash_value):
+        """Record a solution, returns True only for the first node with a valid one."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        digest = hashlib.sha256(job[0].encode() + ascii_nonce(nonce)).hexdigest()
+        if digest != hash_value or int(digest, 16) >= self.target:
+            print(f"[COORDINATOR] Rejected invalid solution from {node_name} for job {job_id}")
+            return False
+        with self.lock:
+            if job_id not in self.jobs:
+                return False
+            del self.jobs[job_id]
+            del self.open_jobs[job[0]]
+            self.solved[job_id] = node_name
+            if len(self.solved) > MAX_SOLVED_JOBS:
+                self.solved.popitem(last=False)
+        print(f"[COORDINATOR] Job {job_id} solved by {node_name} with nonce {nonce}")
+        return True
+
+    def is_solved(self, job_id):
+        with self.lock:
+            return job_id in self.solved
+
+    def handle_node(self, conn):
+        reader = FrameReader(conn)
+        with conn:
+            while True:
+                request = reader.read_message()
+                if request is None:
+                    break
+                if request["op"] == "open":
+                    response = {"job": self.open(request["data"])}
+                elif request["op"] == "lease":
+                    nonce_range = self.lease(request["job"], request["node"])
+                    if nonce_range is None:
+                        response = {"solved": True}
+                    else:
+                        response = {"start": nonce_range[0], "end": nonce_range[1]}
+                elif request["op"] == "status":
+                    response = {"solved": self.is_solved(request["job"])}
+                else:
+                    won = self.submit(request["job"], request["node"], request["nonce"], request["hash"])
+                    response = {"winner": won}
+                send_message(conn, response)
+
+    def serve(self, port=COORDINATOR_PORT):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("localhost", port))
+        server.listen()
+        print(f"[COORDINATOR] Handing out nonce ranges on port {port}")
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self.handle_node, args=(conn,), daemon=True).start()
+
+
+class CoordinatorClient:
+    """A node's connection to the coordinator, kept open for the whole job."""
+
+    def __init__(self, host="localhost", port=COORDINATOR_PORT):
+        self.conn = socket.create_connection((host, port))
+        self.reader = FrameReader(self.conn)
+
+    def _request(self, request):
+        send_message(self.conn, request)
+        return self.reader.read_message()
+
+    def open(self, tx_data):
+        return self._request({"op": "open", "data": tx_data})["job"]
+
+    def lease(self, job_id, node_name):
+        response = self._request({"op": "lease", "job": job_id, "node": node_name})
+        if response.get("solved"):
+            return None
+        return response["start"], response["end"]
+
+    def submit(self, job_id, node_name, nonce, hash_value):
+        response = self._request({"op": "submit", "job": job_id, "node": node_name,
+                                  "nonce": nonce, "hash": hash_value})
+        return response["winner"]
+
+    def is_solved(self, job_id):
+        return self._request({"op": "status", "job": job_id})["solved"]
+
+    def close(self):
+        self.conn.close()
@@ -1,33 +1,33 @@
 # Language: python
 # filepath: lab3/task/pow.py
-import hashlib
+import os
+import sys
 import time
 
-def proof_of_work(data, difficulty=2):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from pow_engine import search_nonce, target_for_zeros
+
+def proof_of_work(data, difficulty=2, cancel=None):
     """
     A simple Proof of Work function that finds a nonce
     such that the hash has 'difficulty' leading zero pairs.
     
     :param data: The transaction data or block data to be hashed.
     :param difficulty: Number of leading zero pairs (e.g., difficulty=2 means "0000")
-    :return: (nonce, hash_value, time_taken)
+    :param cancel: Optional token with is_set() (e.g. threading.Event), checked every few thousand nonces.
+    :return: (nonce, hash_value, time_taken), or None if cancelled first
     """
-    nonce = 0
-    prefix = '0' * (difficulty * 2)  # Two zeros per difficulty level
-    # print(f"Using prefix: {prefix}")  # Debug print removed
+    target = target_for_zeros(difficulty * 2)  # Two zeros per difficulty level
     start_time = time.time()
 
-    while True:
-        text = f"{data}{nonce}".encode()
-        hash_value = hashlib.sha256(text).hexdigest()
-        # Comment out the hash printing
-        # print(hash_value)
-        
-        if hash_value.startswith(prefix):
-            end_time = time.time()
-            # Return with full precision (without rounding)
-            return nonce, hash_value, (end_time - start_time)
-        nonce += 1  # Increment nonce and retry
+    # The data prefix is hashed once, only the nonce is hashed per attempt
+    found = search_nonce(f"{data}", target, cancel=cancel)
+    if found is None:
+        return None  # Another worker already won
+    nonce, hash_value = found
+    end_time = time.time()
+    # Return with full precision (without rounding)
+    return nonce, hash_value, (end_time - start_time)
 
 # Example Usage remains unchanged if you run pow.py directly.
 if __name__ == '__main__':
@@ -3,7 +3,11 @@ import threading
 import hashlib
 import time
 import random
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from blockstore import BlockStore
 
 
 def format_time(timestamp):
@@ -75,18 +79,10 @@ def client():
             "server_hash": fastest_data[5],
             "message": fastest_data[6]
         }
-        try:
-            with open("ledger.json", "r") as ledger_file:
-                ledger = json.load(ledger_file)
-                if not isinstance(ledger, list):
-                    ledger = []
-        except (FileNotFoundError, json.JSONDecodeError):
-            ledger = []
-
-        ledger.append(ledger_entry)
-
-        with open("ledger.json", "w") as ledger_file:
-            json.dump(ledger, ledger_file, indent=4)
+        # Append only the new entry instead of rewriting the whole ledger
+        ledger_store = BlockStore("ledger.jsonl", legacy_json="ledger.json")
+        ledger_store.append(ledger_entry)
+        ledger_store.close()
 
         print(
             f"Fastest Server: {fastest_port}, Time: {fastest_data[0]:.6f} seconds")
@@ -99,4 +95,5 @@ def client():
 
 
 # Start the client to find the fastest server
-client()
+if __name__ == "__main__":
+    client()